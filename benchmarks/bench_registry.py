@@ -0,0 +1,58 @@
+"""Benchmark the disk registry with add, lookup and remove
+
+    python benchmarks/bench_registry.py --count 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qemu_disk_core as qdm
+
+
+def timed(name, count, func):
+    """Run func once and print the per-operation rate"""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {count:>8} ops  {elapsed:8.3f}s  {count / elapsed:12.0f} ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="number of records")
+    args = parser.parse_args()
+
+    paths = [os.path.join(os.sep, "images", f"vm{i // 100}", f"disk{i}.qcow2")
+             for i in range(args.count)]
+    records = [qdm.DiskRecord(p, "qcow2", virtual_size=20 << 30) for p in paths]
+    registry = qdm.DiskRegistry()
+
+    tracemalloc.start()
+
+    def add():
+        for record in records:
+            registry.add(record)
+
+    def lookup():
+        for path in paths:
+            registry.get(path)
+
+    def remove():
+        for record in records:
+            registry.remove(record)
+
+    timed("add", args.count, add)
+    _, peak = tracemalloc.get_traced_memory()
+    timed("lookup", args.count, lookup)
+    timed("remove", args.count, remove)
+    tracemalloc.stop()
+
+    print(f"peak traced memory while filled: {peak / (1 << 20):.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Benchmark the scan, probe, registry, index, table and export hot paths stage by stage
+
+Generates a synthetic tree of small qcow2 and raw images, times each stage
+separately and reports its throughput and peak traced memory. Results can
+be saved as JSON and compared with an earlier run:
+
+    python benchmarks/bench_suite.py --count 5000 --json before.json
+    python benchmarks/bench_suite.py --count 5000 --json after.json --compare before.json
+
+--fake-qemu puts a stub qemu-img on PATH so the qemu-img probe stage runs
+on hosts without QEMU (it measures process overhead, not QEMU itself).
+The table stage needs a display and is skipped without one.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qemu_disk_core as qdm
+from bench_probe import write_qcow2
+
+FAKE_QEMU_IMG = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+if args[:1] != ["info"]:
+    sys.exit(1)
+path = args[-1]
+fmt = "qcow2" if path.endswith(".qcow2") else "raw"
+print(json.dumps({{"filename": path, "format": fmt, "virtual-size": 21474836480,
+                  "actual-size": os.stat(path).st_size, "dirty-flag": False}}))
+'''
+
+
+def make_tree(root, count, fanout):
+    """Create count images spread over nested folders, fanout entries per folder"""
+    for i in range(count):
+        folder = os.path.join(root, f"d{i // fanout % fanout}", f"d{i // (fanout * fanout)}")
+        os.makedirs(folder, exist_ok=True)
+        if i % 2:
+            with open(os.path.join(folder, f"disk{i}.raw"), "wb") as f:
+                f.truncate(64 << 10)
+        else:
+            write_qcow2(os.path.join(folder, f"disk{i}.qcow2"), 20 << 30)
+        # Some files that the walk has to look at and skip
+        if i % 10 == 0:
+            with open(os.path.join(folder, f"notes{i}.txt"), "w") as f:
+                f.write("not a disk\n")
+
+
+def install_fake_qemu(folder):
+    """Write a qemu-img stub into folder and put it first on PATH"""
+    path = os.path.join(folder, "qemu-img")
+    with open(path, "w") as f:
+        f.write(FAKE_QEMU_IMG.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = folder + os.pathsep + os.environ.get("PATH", "")
+
+
+class Suite:
+    """Runs stages and collects their timings"""
+
+    def __init__(self):
+        self.results = {}
+
+    def stage(self, name, ops, func):
+        """Time func(), which handles ops items, and record rate and peak memory"""
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rate = ops / elapsed if elapsed > 0 else 0.0
+        self.results[name] = {"ops": ops, "seconds": round(elapsed, 6),
+                              "ops_per_second": round(rate, 1),
+                              "peak_mib": round(peak / (1 << 20), 3)}
+        print(f"{name:<20} {ops:>8} ops  {elapsed:8.3f}s  {rate:12.0f} ops/s  "
+              f"{peak / (1 << 20):8.1f} MiB peak")
+
+    def skip(self, name, reason):
+        self.results[name] = {"skipped": reason}
+        print(f"{name:<20} skipped ({reason})")
+
+
+def bench_table(suite, records):
+    """Insert records into the virtual table and select rows, with a real Tk window"""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        from qemu_disk_gui import VirtualDiskTable
+    except ImportError as e:
+        reason = str(e)
+    else:
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            reason = str(e)
+        else:
+            reason = None
+    if reason is not None:
+        suite.skip("table insert", reason)
+        suite.skip("table select", reason)
+        return
+
+    root.withdraw()
+    registry = qdm.DiskRegistry()
+    tree = ttk.Treeview(root, columns=("filename", "size", "format", "path"), show="headings")
+    scrollbar = ttk.Scrollbar(root)
+    table = VirtualDiskTable(tree, scrollbar, registry,
+                             lambda disk: (disk.filename, disk.size, disk.format, disk.full_path))
+
+    def insert():
+        for start in range(0, len(records), 500):
+            batch = records[start:start + 500]
+            for record in batch:
+                registry.add(record)
+            table.extend(batch)
+            root.update()
+
+    def select():
+        for record in records[::max(1, len(records) // 1000)]:
+            table.select(record)
+            root.update()
+            assert table.selected is record
+
+    suite.stage("table insert", len(records), insert)
+    suite.stage("table select", len(records[::max(1, len(records) // 1000)]), select)
+    root.destroy()
+
+
+def compare(results, baseline_path):
+    """Print the change in throughput against an earlier JSON result"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["stages"]
+    print(f"\nCompared with {baseline_path}:")
+    for name, result in results.items():
+        old = baseline.get(name, {})
+        if "ops_per_second" not in result or not old.get("ops_per_second"):
+            continue
+        change = (result["ops_per_second"] / old["ops_per_second"] - 1) * 100
+        print(f"{name:<20} {change:+7.1f}% ops/s  "
+              f"{result['peak_mib'] - old.get('peak_mib', 0):+8.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=5000, help="number of images to generate")
+    parser.add_argument("--fanout", type=int, default=20, help="folders per level of the tree")
+    parser.add_argument("--workers", type=int, default=qdm.DEFAULT_PROBE_WORKERS,
+                        help="parallel probes")
+    parser.add_argument("--qemu-count", type=int, default=200,
+                        help="images to probe with qemu-img (0 to skip)")
+    parser.add_argument("--fake-qemu", action="store_true",
+                        help="use a stub qemu-img instead of the installed one")
+    parser.add_argument("--json", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with an earlier JSON result")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="qemu-bench-")
+    suite = Suite()
+    try:
+        tree_root = os.path.join(folder, "images")
+        if args.fake_qemu:
+            bin_folder = os.path.join(folder, "bin")
+            os.makedirs(bin_folder)
+            install_fake_qemu(bin_folder)
+
+        start = time.perf_counter()
+        make_tree(tree_root, args.count, args.fanout)
+        print(f"generated {args.count} images in {time.perf_counter() - start:.1f}s\n")
+
+        entries = []
+        suite.stage("walk", args.count,
+                    lambda: entries.extend(qdm.iter_disk_files(tree_root)))
+
+        cache = qdm.ProbeCache(":memory:")
+        prober = qdm.DiskProber(args.workers, probe=cache.probe)
+        records = []
+
+        def probe():
+            for path, record, error in prober.probe_all(entries):
+                if error is not None:
+                    raise error
+                records.append(record)
+            cache.flush()
+
+        suite.stage("probe (header)", len(entries), probe)
+        suite.stage("probe (cache hit)", len(entries),
+                    lambda: list(prober.probe_all(entries)))
+
+        sample = entries[:args.qemu_count]
+        if not sample:
+            suite.skip("probe (qemu-img)", "--qemu-count 0")
+        elif shutil.which("qemu-img") is None:
+            suite.skip("probe (qemu-img)", "qemu-img not found, try --fake-qemu")
+        else:
+            qemu_prober = qdm.DiskProber(args.workers, probe=qdm.probe_disk)
+            suite.stage("probe (qemu-img)", len(sample),
+                        lambda: list(qemu_prober.probe_all(sample)))
+
+        def dedup():
+            # What a scan does per result: look up the path, add it or count a duplicate
+            registry = qdm.DiskRegistry()
+            for record in records + records:
+                existing = registry.get(record.full_path)
+                if existing is None:
+                    registry.add(record)
+                else:
+                    existing.same_disk(record)
+
+        suite.stage("dedup", len(records) * 2, dedup)
+
+        # Sorting every column once, then typing a search into a table sorted by size
+        registry = qdm.DiskRegistry()
+        for record in records:
+            registry.add(record)
+        columns = list(qdm.DiskIndex.COLUMNS)
+        keystrokes = ["d", "di", "dis", "disk", "disk1", "disk12", "disk123", "disk12", "disk1", ""]
+        suite.stage("index sort", len(columns),
+                    lambda: [registry.index.order(column) for column in columns])
+        suite.stage("index search", len(keystrokes),
+                    lambda: [registry.index.select(text, "size") for text in keystrokes])
+
+        bench_table(suite, records)
+
+        for name in ("export.csv", "export.jsonl", "export.csv.gz"):
+            path = os.path.join(folder, name)
+            suite.stage(name.replace(".", " ", 1), len(records),
+                        lambda: qdm.export_disks(records, path))
+        cache.close()
+    finally:
+        shutil.rmtree(folder)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"date": datetime.now().isoformat(timespec="seconds"),
+                                "python": platform.python_version(),
+                                "platform": platform.platform(),
+                                "count": args.count, "workers": args.workers,
+                                "fake_qemu": args.fake_qemu},
+                       "stages": suite.results}, f, indent=2)
+        print(f"\nsaved results to {args.json}")
+    if args.compare:
+        compare(suite.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,682 @@
+"""Command line interface for the QEMU disk manager
+
+Runs the same engine as the GUI without Tk, for scripts and cron jobs on
+headless hosts:
+
+    python qemu_disk_cli.py scan /var/lib/libvirt/images --output json
+    python qemu_disk_cli.py roots add /mnt/nfs/images -j 4
+    python qemu_disk_cli.py scan --roots
+    python qemu_disk_cli.py check /var/lib/libvirt/images -J 8 --repair leaks
+    python qemu_disk_cli.py snapshot /var/lib/libvirt/images -c pre-maintenance -J 8
+    python qemu_disk_cli.py create /images/vm1.qcow2 20G --format qcow2
+    python qemu_disk_cli.py export /var/lib/libvirt/images -o disks.csv
+    python qemu_disk_cli.py batch-create manifest.yaml -j 8 --dry-run
+    python qemu_disk_cli.py watch /var/lib/libvirt/images --output json
+    python qemu_disk_cli.py chains /var/lib/libvirt/images --dependents base.qcow2
+    python qemu_disk_cli.py convert /images/raw -O qcow2 -c -m 8 -W -j 4
+    python qemu_disk_cli.py analyze /var/lib/libvirt/images --output json
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+from qemu_disk_core import (CHECK_REPAIR_MODES, CONVERT_CACHE_MODES, CONVERT_FORMATS,
+                            DEFAULT_PROBE_WORKERS, EXPORT_FORMATS, ConvertJob, ConvertResult,
+                            CreateResult, DiskProber, DiskRegistry, DiskWatcher, ProbeCache,
+                            ScanRoot, SnapshotResult, batch_create, check_all, convert_all,
+                            convert_sources, convert_target, create_disk_image, export_disks,
+                            export_format, format_size, is_valid_size, iter_disk_files,
+                            list_snapshots, load_manifest, load_scan_roots, map_allocation,
+                            metrics, probe_disk, probe_native, save_scan_roots, scan_roots,
+                            snapshot_all, unique_roots, write_csv)
+
+OUTPUT_FORMATS = ("table", "json", "csv")
+
+
+def open_cache(args):
+    """Open the probe cache unless --no-cache was given"""
+    if args.no_cache:
+        return None
+    try:
+        return ProbeCache(args.cache)
+    except (OSError, sqlite3.Error) as e:
+        print(f"warning: probe cache disabled ({e})", file=sys.stderr)
+        return None
+
+
+def selected_roots(args):
+    """The folders given on the command line plus, with --roots, the saved scan roots"""
+    roots = [ScanRoot(folder, args.jobs) for folder in args.folders]
+    if args.roots:
+        try:
+            roots += [root for root in load_scan_roots() if root.enabled]
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"error: {e}")
+    if not roots:
+        raise SystemExit("error: give at least one folder, or --roots to scan the saved roots")
+    for root in roots:
+        if not os.path.isdir(root.path):
+            raise SystemExit(f"error: not a folder: {root.path}")
+    # A folder given on the command line and also saved is scanned once, with its first settings
+    return unique_roots(roots)
+
+
+def scan_records(args):
+    """Scan every selected root, one shard per root, and return the disk records found"""
+    roots = selected_roots(args)
+    cache = open_cache(args)
+    probe = cache.probe if cache is not None else probe_disk
+    records = {}
+    progress = {}
+    try:
+        for root, record in scan_roots(roots, probe=probe, progress=progress):
+            records.setdefault(record.key, record)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if not args.quiet:
+        if len(roots) > 1:
+            for root in roots:
+                shard = progress[root.path]
+                print(f"{root.path}: {shard.found} found, {shard.probed - shard.failed} probed "
+                      f"in {shard.elapsed():.1f}s ({shard.rate():.1f}/s, {root.workers} workers)",
+                      file=sys.stderr)
+        found = sum(shard.found for shard in progress.values())
+        probed = sum(shard.probed for shard in progress.values())
+        failed = sum(shard.failed for shard in progress.values())
+        summary = f"{found} found, {probed - failed} probed"
+        if failed:
+            summary += f", {failed} failed"
+        if cache is not None:
+            summary += f", cache: {cache.hits} hits, {cache.misses} misses"
+        print(summary, file=sys.stderr)
+    return list(records.values())
+
+
+def write_records(records, output_format, stream):
+    """Write records to a text stream as a table, JSON or CSV"""
+    if output_format == "json":
+        json.dump([record.to_dict() for record in records], stream, indent=2)
+        stream.write("\n")
+    elif output_format == "csv":
+        write_csv(records, stream)
+    else:
+        for record in records:
+            stream.write(f"{record.size:>12}  {record.disk_size:>12}  {record.format:<6}  "
+                         f"{record.full_path}\n")
+
+
+def cmd_scan(args):
+    records = scan_records(args)
+    write_records(records, args.output, sys.stdout)
+    return 0
+
+
+def cmd_export(args):
+    records = scan_records(args)
+    output_format = args.output
+    name = args.file.lower()
+    if output_format is None:
+        output_format = "json" if name.endswith((".json", ".json.gz")) else export_format(name)[0]
+    if output_format == "json":
+        if args.gzip or name.endswith(".gz"):
+            stream = gzip.open(args.file, "wt", newline="", encoding="utf-8")
+        else:
+            stream = open(args.file, "w", newline="", encoding="utf-8")
+        with stream:
+            write_records(records, output_format, stream)
+    else:
+        try:
+            export_disks(records, args.file, output_format, compress=True if args.gzip else None)
+        except ValueError as e:
+            raise SystemExit(f"error: {e}")
+    if not args.quiet:
+        print(f"Exported {len(records)} disk(s) to {args.file}", file=sys.stderr)
+    return 0
+
+
+def cmd_analyze(args):
+    records = scan_records(args)
+    cache = open_cache(args)
+    
+    def analyze(path, st):
+        if cache is not None:
+            return cache.allocation(path)
+        return map_allocation(path)
+    
+    by_path = {record.full_path: record for record in records}
+    failed = 0
+    try:
+        prober = DiskProber(args.jobs, probe=analyze)
+        for path, summary, error in prober.probe_all((path, None) for path in by_path):
+            if error is not None:
+                message = getattr(error, "stderr", None) or str(error)
+                print(f"warning: {path}: {message.strip()}", file=sys.stderr)
+                failed += 1
+            else:
+                by_path[path].allocation = summary
+    finally:
+        if cache is not None:
+            cache.close()
+    
+    if args.output == "json":
+        json.dump([record.to_dict() for record in records], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for record in records:
+            if record.allocation is None:
+                continue
+            print(f"{record.size:>12}  {record.data_size:>12}  {record.data_percent:>6}  "
+                  f"{format_size(record.allocation.zero):>12} zero  {record.full_path}")
+    
+    if not args.quiet:
+        analyzed = [record.allocation for record in records if record.allocation is not None]
+        print(f"{len(analyzed)} analyzed, {failed} failed: "
+              f"{format_size(sum(a.data for a in analyzed))} data, "
+              f"{format_size(sum(a.zero for a in analyzed))} zero, "
+              f"{format_size(sum(a.unallocated for a in analyzed))} unallocated", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_check(args):
+    records = scan_records(args)
+    cache = open_cache(args)
+    by_path = {record.full_path: record for record in records}
+    
+    def on_result(result):
+        by_path[result.path].check = result
+        if args.output == "table":
+            print(result, flush=True)
+    
+    try:
+        results = check_all(list(by_path), max_jobs=args.check_jobs, repair=args.repair,
+                            cache=cache, force=args.force, on_result=on_result)
+    finally:
+        if cache is not None:
+            cache.close()
+    
+    if args.output == "json":
+        json.dump([record.to_dict() for record in records], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    
+    bad = [r for r in results if not r.ok]
+    if not args.quiet:
+        counts = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+        skipped = sum(1 for r in results if r.cached)
+        print(f"{len(results)} checked: {summary or 'nothing to check'}; "
+              f"{skipped} unchanged since their last clean check, "
+              f"{sum(r.leaks for r in results)} leaked and "
+              f"{sum(r.corruptions for r in results)} corrupt clusters left", file=sys.stderr)
+    return 1 if bad else 0
+
+
+def cmd_snapshot(args):
+    records = [record for record in scan_records(args) if record.format == "qcow2"]
+    cache = open_cache(args)
+    try:
+        if args.create or args.apply or args.delete:
+            action, name = (("create", args.create) if args.create else
+                            ("apply", args.apply) if args.apply else ("delete", args.delete))
+            
+            def on_result(result):
+                if args.output == "table":
+                    print(result, flush=True)
+            
+            results = snapshot_all([record.full_path for record in records], action, name,
+                                   max_jobs=args.snapshot_jobs, cache=cache, on_result=on_result)
+            if args.output == "json":
+                json.dump([result.to_dict() for result in results], sys.stdout, indent=2)
+                sys.stdout.write("\n")
+            failed = sum(1 for r in results if r.status == SnapshotResult.FAILED)
+            if not args.quiet:
+                done = sum(1 for r in results if r.status == SnapshotResult.DONE)
+                skipped = sum(1 for r in results if r.status == SnapshotResult.SKIPPED)
+                seconds = sum(r.seconds for r in results if r.status == SnapshotResult.DONE)
+                print(f"{len(results)} image(s): {done} done, {skipped} skipped, {failed} failed"
+                      + (f", {seconds / done:.2f}s per image" if done else ""), file=sys.stderr)
+            return 1 if failed else 0
+        
+        # Unchanged images come from the cache; the rest are listed in parallel
+        def lister(path, st):
+            if cache is not None:
+                return cache.snapshots(path)
+            return list_snapshots(path)
+        
+        by_path = {record.full_path: record for record in records}
+        failed = 0
+        prober = DiskProber(args.snapshot_jobs, probe=lister)
+        for path, snapshots, error in prober.probe_all((path, None) for path in by_path):
+            if error is not None:
+                message = getattr(error, "stderr", None) or str(error)
+                print(f"warning: {path}: {message.strip()}", file=sys.stderr)
+                failed += 1
+            else:
+                by_path[path].snapshots = tuple(snapshots)
+    finally:
+        if cache is not None:
+            cache.close()
+    
+    if args.output == "json":
+        json.dump([{"path": record.full_path,
+                    "snapshots": [snapshot.to_dict() for snapshot in record.snapshots or ()]}
+                   for record in records], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for record in records:
+            for snapshot in record.snapshots or ():
+                print(f"{snapshot}  {record.full_path}")
+    
+    if not args.quiet:
+        listed = [record for record in records if record.snapshots is not None]
+        print(f"{len(listed)} image(s) listed, {failed} failed: "
+              f"{sum(len(record.snapshots) for record in listed)} snapshot(s), "
+              f"{sum(1 for record in listed if record.snapshots)} image(s) with snapshots",
+              file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_chains(args):
+    registry = DiskRegistry()
+    for record in scan_records(args):
+        registry.add(record)
+    graph = registry.graph
+    
+    if args.dependents:
+        dependents = graph.dependents(os.path.abspath(args.dependents))
+        if args.output == "json":
+            json.dump(dependents, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            for key in dependents:
+                print(f"{graph.depth(key):>3}  {key}")
+        return 0
+    
+    bases = [{"path": base, "children": len(graph.children(base)),
+              "dependents": len(graph.dependents(base))} for base in graph.bases()]
+    bases.sort(key=lambda base: base["dependents"], reverse=True)
+    orphans = [{"path": record.full_path, "backing_file": record.backing_chain[0]}
+               for record in graph.orphans()]
+    
+    if args.output == "json":
+        json.dump({"summary": graph.summary(), "bases": bases, "orphans": orphans},
+                  sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    
+    for base in bases:
+        print(f"base    {base['dependents']:>6} dependent(s)  {base['path']}")
+    for orphan in orphans:
+        print(f"orphan  {'':>19}  {orphan['path']} -> {orphan['backing_file']}")
+    summary = graph.summary()
+    if not args.quiet:
+        print(f"{summary['overlays']} overlay(s), {summary['bases']} base(s), "
+              f"{summary['orphans']} orphan(s), deepest chain {summary['max_depth']}",
+              file=sys.stderr)
+    return 0
+
+
+def cmd_convert(args):
+    # Sources are all collected before anything is written, so new targets never join this run
+    sources = []
+    for source in args.sources:
+        if os.path.isdir(source):
+            paths = [path for path, _ in iter_disk_files(source)]
+            found, skipped = convert_sources(paths, args.format, args.output_dir)
+            if not args.quiet:
+                for path, origin in skipped:
+                    print(f"skipping {path}: converted from {origin} earlier", file=sys.stderr)
+            sources.extend(found)
+        elif os.path.isfile(source):
+            sources.append(source)
+        else:
+            raise SystemExit(f"error: no such file or folder: {source}")
+    
+    jobs = []
+    try:
+        for source in sources:
+            target = convert_target(source, args.format, args.output_dir)
+            # Header probing is enough to turn progress into MB/s
+            record = probe_native(source)
+            jobs.append(ConvertJob(source, target, args.format, compress=args.compress,
+                                   coroutines=args.coroutines, out_of_order=args.out_of_order,
+                                   cache=args.cache_mode,
+                                   virtual_size=record.virtual_size if record else None))
+    except ValueError as e:
+        raise SystemExit(f"error: {e}")
+    
+    if args.dry_run:
+        for job in jobs:
+            print(" ".join(job.command()))
+        return 0
+    
+    results = convert_all(jobs, max_jobs=args.jobs, cpu_budget=args.cpu_budget,
+                          on_result=lambda result: print(result, flush=True))
+    
+    failed = sum(1 for r in results if r.status == ConvertResult.FAILED)
+    if not args.quiet:
+        converted = [r for r in results if r.status == ConvertResult.CONVERTED]
+        saved = sum(r.bytes_saved for r in converted)
+        summary = (f"{len(results)} job(s): {len(converted)} converted, {failed} failed, "
+                   f"{'saved' if saved >= 0 else 'grew by'} {format_size(abs(saved))}")
+        if converted:
+            summary += f", {sum(r.rate for r in converted) / len(converted) / 1e6:.1f} MB/s per job"
+        print(summary, file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_roots(args):
+    try:
+        roots = load_scan_roots()
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"error: {e}")
+    
+    if args.action == "add":
+        path = os.path.abspath(args.path)
+        if not os.path.isdir(path):
+            raise SystemExit(f"error: not a folder: {args.path}")
+        roots = [root for root in roots if root.path != path]
+        roots.append(ScanRoot(path, args.jobs))
+        save_scan_roots(roots)
+    elif args.action == "remove":
+        path = os.path.abspath(args.path)
+        if not any(root.path == path for root in roots):
+            raise SystemExit(f"error: not a saved scan root: {args.path}")
+        save_scan_roots([root for root in roots if root.path != path])
+    else:
+        for root in roots:
+            state = "" if root.enabled else "  (disabled)"
+            print(f"{root.workers:>4}  {root.path}{state}")
+    return 0
+
+
+def cmd_create(args):
+    size = args.size.strip().upper()
+    if not is_valid_size(size):
+        raise SystemExit("error: invalid size format, use a size like 20G, 100M or 1T")
+    try:
+        record = create_disk_image(args.path, args.format, size)
+    except subprocess.CalledProcessError as e:
+        print(f"error: failed to create disk: {e.stderr.strip()}", file=sys.stderr)
+        return 1
+    except FileNotFoundError:
+        print("error: qemu-img not found, make sure QEMU is installed and in your PATH",
+              file=sys.stderr)
+        return 1
+    write_records([record], args.output, sys.stdout)
+    return 0
+
+
+def cmd_batch_create(args):
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"error: {args.manifest}: {e}", file=sys.stderr)
+        return 1
+    
+    def on_result(result):
+        if args.output == "table":
+            print(result, flush=True)
+    
+    results = batch_create(jobs, max_workers=args.jobs, dry_run=args.dry_run,
+                           rollback=not args.no_rollback, on_result=on_result)
+    if args.output == "json":
+        json.dump([{"path": r.job.path, "status": r.status, "message": r.message,
+                    "seconds": round(r.seconds, 3)} for r in results], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    
+    elif not args.no_rollback:
+        # Results were printed as they finished; report what the rollback undid
+        for result in results:
+            if result.status == CreateResult.ROLLED_BACK:
+                print(result)
+    
+    failed = sum(1 for r in results if r.status == CreateResult.FAILED)
+    if not args.quiet:
+        created = sum(1 for r in results if r.status == CreateResult.CREATED)
+        print(f"{len(results)} job(s): {created} created, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_watch(args):
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"error: not a folder: {args.folder}")
+    cache = open_cache(args)
+    prober = DiskProber(args.jobs, probe=cache.probe if cache is not None else probe_disk)
+    watcher = DiskWatcher(args.folder, settle=args.settle, poll_interval=args.poll_interval,
+                          use_inotify=not args.poll)
+    
+    def emit(event, path, record=None):
+        if args.output == "json":
+            line = {"event": event, "path": path}
+            if record is not None:
+                line["disk"] = record.to_dict()
+            print(json.dumps(line), flush=True)
+        elif record is not None:
+            print(f"{event:<8}  {record.size:>12}  {record.format:<6}  {path}", flush=True)
+        else:
+            print(f"{event:<8}  {'':>12}  {'':<6}  {path}", flush=True)
+    
+    def on_changes(changed, removed):
+        for path in removed:
+            emit("removed", path)
+        for path, record, error in prober.probe_all(changed):
+            if error is not None:
+                print(f"warning: {path}: {error}", file=sys.stderr)
+            else:
+                emit("changed", path, record)
+        if cache is not None:
+            cache.flush()
+    
+    thread = threading.Thread(target=watcher.run, args=(on_changes,), daemon=True)
+    thread.start()
+    try:
+        if not args.quiet:
+            while watcher.mode is None and thread.is_alive():
+                thread.join(0.05)
+            print(f"Watching {args.folder} ({watcher.mode}), press Ctrl+C to stop",
+                  file=sys.stderr)
+        while thread.is_alive():
+            thread.join(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        thread.join()
+        if cache is not None:
+            cache.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="qemu_disk_manager",
+                                     description="Scan, create and export QEMU virtual disks.")
+    parser.add_argument("--stats", action="store_true",
+                        help="print per-stage timings and counters to stderr when done")
+    parser.add_argument("--log", metavar="FILE",
+                        help="append a JSON line per timed stage to FILE")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="save cProfile data for the whole command to FILE")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_options = argparse.ArgumentParser(add_help=False)
+    scan_options.add_argument("folders", nargs="*", metavar="folder",
+                              help="folder to scan recursively for .qcow2 and .raw files")
+    scan_options.add_argument("--roots", action="store_true",
+                              help="also scan the saved scan roots (see the roots command)")
+    scan_options.add_argument("-j", "--jobs", type=int, default=DEFAULT_PROBE_WORKERS,
+                              help=f"parallel probes per folder (default: {DEFAULT_PROBE_WORKERS})")
+    scan_options.add_argument("--cache", metavar="PATH",
+                              help="probe cache database (default: per-user cache folder)")
+    scan_options.add_argument("--no-cache", action="store_true",
+                              help="always probe files instead of using the cache")
+    scan_options.add_argument("-q", "--quiet", action="store_true",
+                              help="don't print a summary to stderr")
+
+    scan = subparsers.add_parser("scan", parents=[scan_options],
+                                 help="scan folders and print the disks found")
+    scan.add_argument("--output", choices=OUTPUT_FORMATS, default="table",
+                      help="output format (default: table)")
+    scan.set_defaults(func=cmd_scan)
+
+    export = subparsers.add_parser("export", parents=[scan_options],
+                                   help="scan folders and write the disk list to a file")
+    export.add_argument("-o", "--file", required=True, help="output file")
+    export.add_argument("--output", choices=("json",) + EXPORT_FORMATS,
+                        help="output format (default: from the file extension, else csv)")
+    export.add_argument("--gzip", action="store_true",
+                        help="gzip the output, in any format (default: if the file name ends in .gz)")
+    export.set_defaults(func=cmd_export)
+
+    analyze = subparsers.add_parser("analyze", parents=[scan_options],
+                                    help="map data, zero and unallocated extents with qemu-img map")
+    analyze.add_argument("--output", choices=("table", "json"), default="table",
+                         help="output format (default: table)")
+    analyze.set_defaults(func=cmd_analyze)
+
+    check = subparsers.add_parser("check", parents=[scan_options],
+                                  help="check image integrity with qemu-img check")
+    check.add_argument("-r", "--repair", choices=CHECK_REPAIR_MODES,
+                       help="repair leaked clusters, or all errors (qemu-img check -r)")
+    check.add_argument("-J", "--check-jobs", type=int, default=4,
+                       help="checks running at once, largest images first (default: 4)")
+    check.add_argument("--force", action="store_true",
+                       help="check images again even if unchanged since their last clean check")
+    check.add_argument("--output", choices=("table", "json"), default="table",
+                       help="output format (default: table)")
+    check.set_defaults(func=cmd_check)
+
+    snapshot = subparsers.add_parser("snapshot", parents=[scan_options],
+                                     help="list, create, apply or delete internal qcow2 snapshots")
+    snapshot_action = snapshot.add_mutually_exclusive_group()
+    snapshot_action.add_argument("-l", "--list", action="store_true",
+                                 help="list the snapshots of every image (default)")
+    snapshot_action.add_argument("-c", "--create", metavar="NAME",
+                                 help="create snapshot NAME on every image")
+    snapshot_action.add_argument("-a", "--apply", metavar="NAME",
+                                 help="revert every image to snapshot NAME")
+    snapshot_action.add_argument("-d", "--delete", metavar="NAME",
+                                 help="delete snapshot NAME from every image")
+    snapshot.add_argument("-J", "--snapshot-jobs", type=int, default=4,
+                          help="images handled at once (default: 4)")
+    snapshot.add_argument("--output", choices=("table", "json"), default="table",
+                          help="output format (default: table)")
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    chains = subparsers.add_parser("chains", parents=[scan_options],
+                                   help="report base images, overlays and orphaned overlays")
+    chains.add_argument("--dependents", metavar="IMAGE",
+                        help="list every overlay that depends on IMAGE instead")
+    chains.add_argument("--output", choices=("table", "json"), default="table",
+                        help="output format (default: table)")
+    chains.set_defaults(func=cmd_chains)
+
+    convert = subparsers.add_parser("convert", help="convert or recompress images in parallel")
+    convert.add_argument("sources", nargs="+", metavar="source",
+                         help="image to convert, or folder to convert every image in")
+    convert.add_argument("-O", "--format", choices=CONVERT_FORMATS, default="qcow2",
+                         help="target format (default: qcow2)")
+    convert.add_argument("-c", "--compress", action="store_true",
+                         help="compress the target (qcow2 only)")
+    convert.add_argument("-m", "--coroutines", type=int, metavar="N",
+                         help="parallel coroutines per conversion, 1-16 (qemu-img default: 8)")
+    convert.add_argument("-W", "--out-of-order", action="store_true",
+                         help="allow out-of-order writes to the target")
+    convert.add_argument("-t", "--cache-mode", choices=CONVERT_CACHE_MODES, default="",
+                         help="target cache mode")
+    convert.add_argument("-d", "--output-dir", metavar="DIR",
+                         help="write targets here (default: next to each source)")
+    convert.add_argument("-j", "--jobs", type=int, default=2,
+                         help="conversions running at once, the I/O budget (default: 2)")
+    convert.add_argument("--cpu-budget", type=int, metavar="CORES",
+                         help="cores compressed conversions may use together "
+                              "(default: all)")
+    convert.add_argument("--dry-run", action="store_true",
+                         help="print the qemu-img commands without running them")
+    convert.add_argument("-q", "--quiet", action="store_true",
+                         help="don't print a summary to stderr")
+    convert.set_defaults(func=cmd_convert)
+
+    roots = subparsers.add_parser("roots", help="list, add or remove saved scan roots")
+    roots.add_argument("action", choices=("list", "add", "remove"), nargs="?", default="list")
+    roots.add_argument("path", nargs="?", help="folder to add or remove")
+    roots.add_argument("-j", "--jobs", type=int, default=DEFAULT_PROBE_WORKERS,
+                       help=f"parallel probes for this root (default: {DEFAULT_PROBE_WORKERS})")
+    roots.set_defaults(func=cmd_roots)
+
+    create = subparsers.add_parser("create", help="create a new virtual disk")
+    create.add_argument("path", help="disk file to create")
+    create.add_argument("size", help="virtual size, e.g. 20G, 100M, 1T")
+    create.add_argument("-f", "--format", choices=("qcow2", "raw"), default="qcow2",
+                        help="disk format (default: qcow2)")
+    create.add_argument("--output", choices=OUTPUT_FORMATS, default="table",
+                        help="output format (default: table)")
+    create.set_defaults(func=cmd_create)
+
+    batch = subparsers.add_parser("batch-create",
+                                  help="create the disks listed in a CSV, JSON or YAML manifest")
+    batch.add_argument("manifest", help="manifest with path, format, size, preallocation, "
+                                        "cluster_size, backing_file and backing_format columns")
+    batch.add_argument("-j", "--jobs", type=int, default=DEFAULT_PROBE_WORKERS,
+                       help=f"parallel qemu-img create jobs (default: {DEFAULT_PROBE_WORKERS})")
+    batch.add_argument("--dry-run", action="store_true",
+                       help="validate the manifest and print the commands without running them")
+    batch.add_argument("--no-rollback", action="store_true",
+                       help="keep disks that were created when another job fails")
+    batch.add_argument("--output", choices=("table", "json"), default="table",
+                       help="output format (default: table)")
+    batch.add_argument("-q", "--quiet", action="store_true",
+                       help="don't print a summary to stderr")
+    batch.set_defaults(func=cmd_batch_create)
+
+    watch = subparsers.add_parser("watch",
+                                  help="print disks as they are added, changed or removed")
+    watch.add_argument("folder", help="folder to watch recursively")
+    watch.add_argument("-j", "--jobs", type=int, default=DEFAULT_PROBE_WORKERS,
+                       help=f"parallel probes (default: {DEFAULT_PROBE_WORKERS})")
+    watch.add_argument("--settle", type=float, default=2.0, metavar="SECONDS",
+                       help="report a file only after it has been quiet this long (default: 2)")
+    watch.add_argument("--poll", action="store_true",
+                       help="poll instead of using inotify")
+    watch.add_argument("--poll-interval", type=float, default=10.0, metavar="SECONDS",
+                       help="seconds between walks when polling (default: 10)")
+    watch.add_argument("--cache", metavar="PATH",
+                       help="probe cache database (default: per-user cache folder)")
+    watch.add_argument("--no-cache", action="store_true",
+                       help="always probe files instead of using the cache")
+    watch.add_argument("--output", choices=("table", "json"), default="table",
+                       help="output format (default: table)")
+    watch.add_argument("-q", "--quiet", action="store_true",
+                       help="don't print status messages to stderr")
+    watch.set_defaults(func=cmd_watch)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.log:
+        metrics.open_log(args.log)
+    if args.profile:
+        metrics.start_profiling()
+    try:
+        return metrics.profiled(args.func, args)
+    finally:
+        if args.profile:
+            metrics.stop_profiling(args.profile)
+        if args.log:
+            metrics.close_log()
+        if args.stats:
+            print(metrics.report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2919 @@
+"""GUI-free engine for QEMU disk management
+
+Scanning, probing, caching, disk creation and export live here so they can
+be used from the Tk GUI, the command line or other scripts without Tk.
+"""
+import bisect
+import cProfile
+import csv
+import gzip
+import io
+import json
+import os
+import pstats
+import queue
+import re
+import select
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from datetime import datetime
+
+__all__ = [
+    "DEFAULT_PROBE_WORKERS", "DISK_EXTENSIONS", "EXCLUDED_DIRS", "CSV_FIELDS",
+    "run_qemu_info", "parse_qemu_info", "probe_disk", "probe_native", "read_qcow2_header",
+    "resolve_backing_path", "follow_backing_chain", "format_size", "parse_size",
+    "normalize_path", "chain_key", "default_cache_path", "iter_disk_files", "scan_disks",
+    "is_valid_size", "create_disk_image", "load_manifest", "run_create_job", "batch_create",
+    "write_csv", "ProbeCache", "DiskProber", "DiskRecord", "DiskRegistry", "BackingGraph",
+    "ScanProgress", "CreateJob", "CreateResult", "DiskWatcher", "ConvertJob", "ConvertResult",
+    "convert_target", "run_convert_job", "convert_all", "AllocationSummary", "iter_qemu_map",
+    "map_allocation", "EXPORT_FORMATS", "iter_export_rows", "export_format", "export_disks",
+    "Metrics", "metrics", "ScanRoot", "default_config_path", "load_scan_roots", "save_scan_roots",
+    "scan_roots", "DiskIndex", "CHECK_REPAIR_MODES", "CheckResult", "check_disk", "check_all",
+    "SNAPSHOT_ACTIONS", "Snapshot", "SnapshotResult", "parse_snapshot_list", "list_snapshots",
+    "run_snapshot", "snapshot_all",
+]
+
+# Upper bound on concurrent qemu-img probes; probing is I/O and fork bound,
+# so a few workers per core keeps both the CPU and the storage queue busy
+DEFAULT_PROBE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+class Metrics:
+    """Timing spans and counters for the hot paths, shared by every thread
+    
+    Each stage keeps its call count, total and maximum, plus the most recent
+    SAMPLES durations for percentiles. When a log file is open every span is
+    also written to it as a JSON line. While profiling is on, work wrapped in
+    profiled() runs under a per-thread cProfile profiler and the profiles
+    are merged when profiling stops.
+    """
+    
+    SAMPLES = 2048
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # stage -> recent durations in seconds
+        self._totals = {}  # stage -> [count, total seconds, max seconds]
+        self.counters = {}
+        self._log = None
+        self._profiles = None  # List of per-thread profilers while profiling
+        self._local = threading.local()
+    
+    @contextmanager
+    def span(self, stage, **fields):
+        """Time the body of a with statement as one call of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, **fields)
+    
+    def record(self, stage, seconds, **fields):
+        """Add one duration to a stage; extra fields only go to the log"""
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.SAMPLES)
+                self._totals[stage] = [0, 0.0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            if self._log is not None:
+                self._write_log(dict(event="span", stage=stage, ms=round(seconds * 1000, 3),
+                                     **fields))
+    
+    def count(self, counter, amount=1):
+        """Increase a counter"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+    
+    def stats(self):
+        """Per-stage count, total, mean, p50, p95 and max, in seconds"""
+        with self._lock:
+            snapshot = {stage: (sorted(self._samples[stage]), list(totals))
+                        for stage, totals in self._totals.items()}
+        stats = {}
+        for stage, (samples, (count, total, longest)) in snapshot.items():
+            stats[stage] = {
+                "count": count,
+                "total": total,
+                "mean": total / count,
+                "p50": samples[int(0.50 * (len(samples) - 1))],
+                "p95": samples[int(0.95 * (len(samples) - 1))],
+                "max": longest,
+            }
+        return stats
+    
+    def report(self):
+        """Stage timings and counters as a text table"""
+        lines = [f"{'Stage':<28} {'Count':>8} {'p50 ms':>9} {'p95 ms':>9} {'Max ms':>9} {'Total s':>9}"]
+        for stage, row in sorted(self.stats().items()):
+            lines.append(f"{stage:<28} {row['count']:>8} {row['p50'] * 1000:>9.2f} "
+                         f"{row['p95'] * 1000:>9.2f} {row['max'] * 1000:>9.2f} {row['total']:>9.2f}")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        if counters:
+            lines.append("")
+            lines.append(f"{'Counter':<28} {'Value':>8}")
+            lines.extend(f"{name:<28} {value:>8}" for name, value in counters)
+        return "\n".join(lines)
+    
+    def reset(self):
+        """Forget every span and counter"""
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+            self.counters.clear()
+    
+    def open_log(self, log_path):
+        """Append every span to a JSON-lines log file from now on"""
+        log = open(log_path, "a", encoding="utf-8", buffering=1)
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._log = log
+    
+    def close_log(self):
+        """Stop writing the log file"""
+        with self._lock:
+            if self._log is not None:
+                self._write_log({"event": "counters", "counters": dict(self.counters)})
+                self._log.close()
+                self._log = None
+    
+    def _write_log(self, entry):
+        entry["ts"] = round(time.time(), 6)
+        entry["thread"] = threading.current_thread().name
+        self._log.write(json.dumps(entry) + "\n")
+    
+    @property
+    def profiling(self):
+        return self._profiles is not None
+    
+    def start_profiling(self):
+        """Start capturing cProfile data for work run through profiled()"""
+        with self._lock:
+            self._profiles = []
+    
+    def stop_profiling(self, output_path=None):
+        """Stop profiling and return the merged pstats.Stats (None if nothing ran)
+        
+        If output_path is given the stats are also saved there for
+        python -m pstats or snakeviz.
+        """
+        with self._lock:
+            profiles, self._profiles = self._profiles, None
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        if output_path:
+            stats.dump_stats(output_path)
+        return stats
+    
+    def profiled(self, func, *args, **kwargs):
+        """Call func, under this thread's profiler while profiling is on"""
+        profiles = self._profiles
+        local = self._local
+        if profiles is None or getattr(local, "depth", 0):
+            return func(*args, **kwargs)
+        
+        if getattr(local, "profiles", None) is not profiles:
+            # First profiled call on this thread since profiling started
+            local.profiles = profiles
+            local.profile = cProfile.Profile()
+            with self._lock:
+                profiles.append(local.profile)
+        try:
+            local.profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return func(*args, **kwargs)
+        local.depth = 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            local.profile.disable()
+            local.depth = 0
+
+
+# Process-wide instrumentation used by the engine, the GUI and the CLI
+metrics = Metrics()
+
+
+def run_qemu_info(file_path):
+    """Run qemu-img info --output=json on a disk file and return the JSON text"""
+    cmd = ["qemu-img", "info", "--output=json", file_path]
+    metrics.count("subprocess: qemu-img info")
+    with metrics.span("qemu-img info"):
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def iter_qemu_map(file_path):
+    """Run qemu-img map --output=json and yield its extents one at a time
+    
+    qemu-img prints one extent object per line, so the output is parsed as
+    it arrives and the extent list of a large image is never held in memory.
+    """
+    cmd = ["qemu-img", "map", "--output=json", file_path]
+    metrics.count("subprocess: qemu-img map")
+    # stderr goes to a file: a full stderr pipe would block qemu-img while we wait on stdout
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+        try:
+            for line in proc.stdout:
+                line = line.strip().lstrip("[,").rstrip("],").strip()
+                if line:
+                    yield json.loads(line)
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                # Consumer stopped early
+                proc.kill()
+            proc.wait()
+        if proc.returncode:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace")
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+
+def parse_qemu_info(file_path, output):
+    """Parse qemu-img info JSON output into a DiskRecord"""
+    with metrics.span("parse qemu-img info"):
+        info = json.loads(output)
+    backing_file = info.get("backing-filename", "")
+    disk_format = info.get("format")
+    if not disk_format:
+        # Fallback: determine from file extension
+        disk_format = "qcow2" if file_path.lower().endswith('.qcow2') else "raw"
+    
+    return DiskRecord(file_path, disk_format,
+                      virtual_size=info.get("virtual-size"),
+                      actual_size=info.get("actual-size"),
+                      cluster_size=info.get("cluster-size"),
+                      dirty=bool(info.get("dirty-flag", False)),
+                      backing_file=backing_file,
+                      backing_chain=follow_backing_chain(file_path, backing_file))
+
+
+def probe_disk(file_path, st=None):
+    """Run qemu-img info on a disk file and return its DiskRecord
+    
+    st is unused; it is accepted so every probe (this, probe_native and
+    ProbeCache.probe) can be called as probe(path, stat_result) by DiskProber.
+    """
+    return parse_qemu_info(file_path, run_qemu_info(file_path))
+
+
+# qcow2 header up to the L1 table location (see docs/interop/qcow2.txt in QEMU)
+QCOW2_MAGIC = b"QFI\xfb"
+QCOW2_HEADER = struct.Struct(">4sIQIIQIIQ")
+# Version 3 header fields from offset 72: feature bitmaps, refcount order, header length
+QCOW2_V3_HEADER = struct.Struct(">QQQII")
+QCOW2_V3_OFFSET = 72
+QCOW2_DIRTY_BIT = 1
+NATIVE_QCOW2_VERSIONS = (2, 3)
+MAX_BACKING_CHAIN = 64
+
+# Leading bytes of other formats qemu-img would detect; these are never treated as raw
+OTHER_IMAGE_MAGICS = (b"KDMV", b"# Disk DescriptorFile", b"conectix", b"vhdxfile",
+                      b"QED\x00", b"LUKS\xba\xbe", b"WithoutFreeSpace", b"ParallelsDiskImage")
+VDI_MAGIC_OFFSET = 64
+VDI_MAGIC = b"\x7f\x10\xda\xbe"
+
+
+def format_size(num_bytes):
+    """Format a byte count the way qemu-img does (e.g. "20 GiB", "1.5 MiB")"""
+    suffixes = ("B", "KiB", "MiB", "GiB", "TiB", "PiB", "EiB")
+    value = float(num_bytes)
+    index = 0
+    # Like qemu, switch units at 1000 so the number never needs four digits
+    while value >= 1000 and index < len(suffixes) - 1:
+        value /= 1024
+        index += 1
+    return f"{value:.3g} {suffixes[index]}"
+
+
+def read_qcow2_header(file_path):
+    """Read the fixed qcow2 header fields, or return None if the file isn't qcow2"""
+    with open(file_path, "rb") as f:
+        header = f.read(QCOW2_V3_OFFSET + QCOW2_V3_HEADER.size)
+        if len(header) < QCOW2_HEADER.size or header[:4] != QCOW2_MAGIC:
+            return None
+        
+        (magic, version, backing_file_offset, backing_file_size, cluster_bits,
+         size, crypt_method, l1_size, l1_table_offset) = QCOW2_HEADER.unpack_from(header)
+        
+        incompatible_features = 0
+        if version >= 3 and len(header) >= QCOW2_V3_OFFSET + QCOW2_V3_HEADER.size:
+            incompatible_features = QCOW2_V3_HEADER.unpack_from(header, QCOW2_V3_OFFSET)[0]
+        
+        # The backing file name is stored unterminated and is at most 1023 bytes
+        backing_file = ""
+        if backing_file_offset and 0 < backing_file_size < 1024:
+            f.seek(backing_file_offset)
+            backing_file = f.read(backing_file_size).decode("utf-8", "replace")
+    
+    return {
+        "magic": magic,
+        "version": version,
+        "size": size,
+        "cluster_bits": cluster_bits,
+        "crypt_method": crypt_method,
+        "backing_file": backing_file,
+        "l1_size": l1_size,
+        "l1_table_offset": l1_table_offset,
+        "incompatible_features": incompatible_features
+    }
+
+
+def resolve_backing_path(image_path, backing_file):
+    """Resolve a backing file name the way qemu-img does, relative to the image's folder
+    
+    Protocol and json: backing specifications are returned unchanged.
+    """
+    if "://" in backing_file or backing_file.startswith("json:"):
+        return backing_file
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(image_path)),
+                                         backing_file))
+
+
+def follow_backing_chain(file_path, backing_file):
+    """Return the resolved backing chain of an image, nearest backing file first
+    
+    Walks qcow2 headers only, so it costs one small read per link. The walk
+    stops at a backing file that is missing, isn't qcow2 or has no backing
+    file of its own; a loop or an absurdly deep chain is cut off.
+    """
+    chain = []
+    current = file_path
+    while backing_file and len(chain) < MAX_BACKING_CHAIN:
+        path = resolve_backing_path(current, backing_file)
+        if path in chain:
+            break
+        chain.append(path)
+        try:
+            header = read_qcow2_header(path)
+        except OSError:
+            break
+        if header is None:
+            break
+        current, backing_file = path, header["backing_file"]
+    return tuple(chain)
+
+
+def allocated_bytes(st):
+    """Host bytes allocated to a file (falls back to its size where st_blocks is missing)"""
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def probe_native(file_path, st=None):
+    """Read the image metadata straight from its header and return a DiskRecord
+    
+    Handles qcow2 versions 2 and 3 and raw files. Returns None when the
+    image is some other format or version, and qemu-img has to be asked.
+    """
+    if st is None:
+        st = os.stat(file_path)
+    
+    header = read_qcow2_header(file_path)
+    if header is not None:
+        if header["version"] not in NATIVE_QCOW2_VERSIONS:
+            return None
+        disk_format = "qcow2"
+        virtual_size = header["size"]
+        cluster_size = 1 << header["cluster_bits"]
+        dirty = bool(header["incompatible_features"] & QCOW2_DIRTY_BIT)
+        backing_file = header["backing_file"]
+    else:
+        # Only files named .raw are taken as raw, and only if no other format claims them
+        if not file_path.lower().endswith(".raw"):
+            return None
+        with open(file_path, "rb") as f:
+            lead = f.read(VDI_MAGIC_OFFSET + len(VDI_MAGIC))
+        if (lead.startswith(OTHER_IMAGE_MAGICS) or
+                lead[VDI_MAGIC_OFFSET:] == VDI_MAGIC):
+            return None
+        disk_format = "raw"
+        virtual_size = st.st_size
+        cluster_size = None
+        dirty = False
+        backing_file = ""
+    
+    return DiskRecord(file_path, disk_format,
+                      virtual_size=virtual_size,
+                      actual_size=allocated_bytes(st),
+                      cluster_size=cluster_size,
+                      dirty=dirty,
+                      backing_file=backing_file,
+                      backing_chain=follow_backing_chain(file_path, backing_file))
+
+
+def normalize_path(path):
+    """Normalize a path for use as a lookup key"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def default_cache_path():
+    """Location of the persistent probe cache database"""
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "qemu-disk-manager", "probe_cache.sqlite3")
+
+
+class ProbeCache:
+    """Persistent cache of disk probe results
+    
+    Entries are keyed by normalized path and are only valid while the file's
+    size, mtime_ns and inode are unchanged; any difference is a miss and the
+    entry is replaced by the next probe. Allocation maps, clean integrity
+    checks and snapshot lists are cached the same way, in their own tables.
+    Safe to use from several threads.
+    """
+    
+    SCHEMA_VERSION = 6
+    FLUSH_EVERY = 200
+    
+    def __init__(self, db_path=None, use_native=True):
+        self.db_path = db_path or default_cache_path()
+        self.use_native = use_native
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = []
+        self.hits = 0
+        self.misses = 0
+        
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            # Entries from an older layout are just probed again
+            self._conn.execute("DROP TABLE IF EXISTS probes")
+            self._conn.execute("DROP TABLE IF EXISTS allocation")
+            self._conn.execute("DROP TABLE IF EXISTS checks")
+            self._conn.execute("DROP TABLE IF EXISTS snapshots")
+            self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS probes (
+                path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                format TEXT,
+                virtual_size INTEGER,
+                actual_size INTEGER,
+                cluster_size INTEGER,
+                dirty INTEGER,
+                backing_file TEXT,
+                backing_chain TEXT,
+                info_json TEXT
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS allocation (
+                path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                data INTEGER,
+                zero INTEGER,
+                backing INTEGER,
+                unallocated INTEGER,
+                extents INTEGER
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checks (
+                path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                status TEXT,
+                leaks INTEGER,
+                corruptions INTEGER,
+                check_errors INTEGER,
+                leaks_fixed INTEGER,
+                corruptions_fixed INTEGER,
+                seconds REAL
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                snapshots_json TEXT
+            )""")
+        self._conn.commit()
+    
+    @staticmethod
+    def file_key(file_path, st=None):
+        """Return the (path, size, mtime_ns, inode) key for a file"""
+        if st is None:
+            st = os.stat(file_path)
+        return (normalize_path(file_path), st.st_size, st.st_mtime_ns, st.st_ino)
+    
+    def reset_stats(self):
+        """Reset the hit and miss counters"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+    
+    def lookup(self, file_path, st=None):
+        """Return (record, info_json) for an unchanged file, or None"""
+        key = self.file_key(file_path, st)
+        with self._lock:
+            # An allocation map, a clean check and the snapshot list of the same
+            # file version come along for free
+            row = self._conn.execute(
+                "SELECT p.format, p.virtual_size, p.actual_size, p.cluster_size, p.dirty, "
+                "p.backing_file, p.backing_chain, p.info_json, "
+                "a.data, a.zero, a.backing, a.unallocated, a.extents, "
+                "c.status, c.leaks, c.corruptions, c.check_errors, c.leaks_fixed, "
+                "c.corruptions_fixed, c.seconds, s.snapshots_json FROM probes p "
+                "LEFT JOIN allocation a ON a.path = p.path AND a.file_size = p.file_size "
+                "AND a.mtime_ns = p.mtime_ns AND a.inode = p.inode "
+                "LEFT JOIN checks c ON c.path = p.path AND c.file_size = p.file_size "
+                "AND c.mtime_ns = p.mtime_ns AND c.inode = p.inode "
+                "LEFT JOIN snapshots s ON s.path = p.path AND s.file_size = p.file_size "
+                "AND s.mtime_ns = p.mtime_ns AND s.inode = p.inode "
+                "WHERE p.path = ? AND p.file_size = ? AND p.mtime_ns = ? AND p.inode = ?",
+                key).fetchone()
+            if row is None:
+                # Pending writes have not reached the database yet
+                for pending in self._pending:
+                    if pending[:4] == key:
+                        row = pending[4:] + (None,) * (len(AllocationSummary.FIELDS) + 8)
+                        break
+            if row is None:
+                self.misses += 1
+                metrics.count("probe cache miss")
+                return None
+            self.hits += 1
+        metrics.count("probe cache hit")
+        
+        (disk_format, virtual_size, actual_size, cluster_size, dirty, backing_file,
+         backing_chain, info_json) = row[:8]
+        allocation = AllocationSummary(*row[8:13]) if row[8] is not None else None
+        check = self._check_result(file_path, row[13:20]) if row[13] is not None else None
+        snapshots = self._snapshot_list(row[20]) if row[20] is not None else None
+        record = DiskRecord(file_path, disk_format, virtual_size, actual_size, cluster_size,
+                            bool(dirty), backing_file or "", json.loads(backing_chain or "[]"),
+                            allocation, check, snapshots)
+        return record, info_json
+    
+    def store(self, file_path, record, info_json, st=None):
+        """Remember a probe result for the file's current version"""
+        row = self.file_key(file_path, st) + (
+            record.format, record.virtual_size, record.actual_size, record.cluster_size,
+            int(record.dirty), record.backing_file, json.dumps(list(record.backing_chain)),
+            info_json)
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.FLUSH_EVERY:
+                self._flush_locked()
+    
+    def flush(self):
+        """Write pending entries to disk"""
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with metrics.span("probe cache flush", rows=len(self._pending)):
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending)
+            self._conn.commit()
+        self._pending = []
+    
+    def probe(self, file_path, st=None):
+        """Return the DiskRecord for a file, reading the header or running qemu-img only on a miss"""
+        if st is None:
+            st = os.stat(file_path)
+        cached = self.lookup(file_path, st)
+        if cached is not None:
+            return cached[0]
+        
+        if self.use_native:
+            with metrics.span("probe native header"):
+                record = probe_native(file_path, st)
+            if record is not None:
+                # No qemu-img output yet; Get Disk Info fetches it on demand
+                self.store(file_path, record, None, st)
+                return record
+        
+        info_json = run_qemu_info(file_path)
+        record = parse_qemu_info(file_path, info_json)
+        self.store(file_path, record, info_json, st)
+        return record
+    
+    def info_json(self, file_path):
+        """Return qemu-img info JSON output for a file, from the cache when it is current"""
+        st = os.stat(file_path)
+        cached = self.lookup(file_path, st)
+        if cached is not None and cached[1]:
+            return cached[1]
+        
+        info_json = run_qemu_info(file_path)
+        self.store(file_path, parse_qemu_info(file_path, info_json), info_json, st)
+        self.flush()
+        return info_json
+    
+    def allocation(self, file_path, st=None, stop=None):
+        """Return the AllocationSummary of a file, running qemu-img map only if it changed
+        
+        Returns None if stop() cancelled the map.
+        """
+        key = self.file_key(file_path, st)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, zero, backing, unallocated, extents FROM allocation "
+                "WHERE path = ? AND file_size = ? AND mtime_ns = ? AND inode = ?", key).fetchone()
+        if row is not None:
+            return AllocationSummary(*row)
+        
+        summary = map_allocation(file_path, stop=stop)
+        if summary is not None:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO allocation VALUES "
+                                   "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   key + tuple(getattr(summary, name)
+                                               for name in AllocationSummary.FIELDS))
+                self._conn.commit()
+        return summary
+    
+    @staticmethod
+    def _check_result(file_path, row):
+        status, leaks, corruptions, check_errors, leaks_fixed, corruptions_fixed, seconds = row
+        return CheckResult(file_path, status, leaks, corruptions, check_errors, leaks_fixed,
+                           corruptions_fixed, seconds=seconds, cached=True)
+    
+    def check(self, file_path, repair=None, stop=None, force=False):
+        """Return the CheckResult of a file, skipping qemu-img check if it passed unchanged
+        
+        Only clean (or unsupported) results are cached, so an image with
+        problems is checked again every time; force always runs the check.
+        """
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            return CheckResult(file_path, CheckResult.FAILED, message=str(e))
+        key = self.file_key(file_path, st)
+        if not force:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT status, leaks, corruptions, check_errors, leaks_fixed, "
+                    "corruptions_fixed, seconds FROM checks "
+                    "WHERE path = ? AND file_size = ? AND mtime_ns = ? AND inode = ?", key).fetchone()
+            if row is not None:
+                metrics.count("check cache hit")
+                return self._check_result(file_path, row)
+        
+        result = check_disk(file_path, repair=repair, stop=stop)
+        if result.ok:
+            if repair:
+                # A repair rewrites metadata, so the clean version is the new one
+                key = self.file_key(file_path)
+            # What a repair fixed is reported once; the cached entry is just clean
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO checks VALUES "
+                                   "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   key + (result.status, result.leaks, result.corruptions,
+                                          result.check_errors, 0, 0, result.seconds))
+                self._conn.commit()
+        return result
+    
+    @staticmethod
+    def _snapshot_list(snapshots_json):
+        return tuple(Snapshot(**snapshot) for snapshot in json.loads(snapshots_json))
+    
+    def snapshots(self, file_path, st=None):
+        """Return the internal snapshots of a file, running qemu-img snapshot -l only if it changed"""
+        key = self.file_key(file_path, st)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT snapshots_json FROM snapshots "
+                "WHERE path = ? AND file_size = ? AND mtime_ns = ? AND inode = ?", key).fetchone()
+        if row is not None:
+            metrics.count("snapshot cache hit")
+            return self._snapshot_list(row[0])
+        
+        snapshots = list_snapshots(file_path)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                               key + (json.dumps([snapshot.to_dict() for snapshot in snapshots]),))
+            self._conn.commit()
+        return snapshots
+    
+    def close(self):
+        """Flush pending entries and close the database"""
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
+
+
+DISK_EXTENSIONS = (".qcow2", ".raw")
+
+# Directories that never hold images worth listing
+EXCLUDED_DIRS = frozenset({".git", ".svn", "__pycache__", "lost+found", ".snapshot",
+                           "$RECYCLE.BIN", "System Volume Information"})
+
+
+def _entry_stat(entry):
+    """Stat a directory entry, following symlinks
+    
+    On Windows DirEntry.stat() leaves st_ino and st_dev at zero, which would
+    break both loop detection and cache keys, so os.stat() is used there.
+    """
+    if os.name == "nt":
+        return os.stat(entry.path)
+    return entry.stat()
+
+
+def iter_disk_files(folder, extensions=DISK_EXTENSIONS, exclude_dirs=EXCLUDED_DIRS, stop=None,
+                    on_dir=None):
+    """Walk folder once, yielding (path, stat_result) for each disk image as it is found
+    
+    Matches every extension in a single os.scandir pass, stats each match
+    once, skips excluded directory names and follows directory symlinks
+    without ever entering the same directory twice. stop is an optional
+    callable checked before each directory; returning True ends the walk.
+    on_dir, if given, is called with each directory before it is listed.
+    """
+    try:
+        root_st = os.stat(folder)
+    except OSError:
+        return
+    seen = {(root_st.st_dev, root_st.st_ino)}
+    stack = [folder]
+    
+    while stack:
+        if stop is not None and stop():
+            return
+        directory = stack.pop()
+        if on_dir is not None:
+            on_dir(directory)
+        subdirs = []
+        started = time.perf_counter()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if entry.name in exclude_dirs:
+                                continue
+                            st = _entry_stat(entry)
+                            dir_key = (st.st_dev, st.st_ino)
+                            if dir_key not in seen:
+                                seen.add(dir_key)
+                                subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(extensions) and entry.is_file():
+                            st = _entry_stat(entry)
+                            # Time spent by the consumer is not part of the walk
+                            paused = time.perf_counter()
+                            yield entry.path, st
+                            started += time.perf_counter() - paused
+                    except OSError:
+                        # Broken symlink or entry removed mid-walk
+                        continue
+        except OSError:
+            # Unreadable directory
+            continue
+        finally:
+            metrics.record("walk directory", time.perf_counter() - started)
+        # Visit subdirectories in listing order
+        stack.extend(reversed(subdirs))
+
+
+class DiskProber:
+    """Bounded worker pool that runs disk probes concurrently"""
+    
+    def __init__(self, max_workers=DEFAULT_PROBE_WORKERS, probe=probe_disk):
+        self.max_workers = max(1, int(max_workers))
+        self.probe = probe
+    
+    def _probe(self, path, st):
+        with metrics.span("probe file"):
+            return metrics.profiled(self.probe, path, st)
+    
+    def probe_all(self, entries):
+        """Probe files in parallel, yielding (path, record, error) as each finishes
+        
+        entries yields (path, stat_result) pairs, as from iter_disk_files();
+        the stat result may be None. At most 2 * max_workers probes are queued
+        at any time, so entries can be a lazy walk and results start flowing
+        immediately.
+        """
+        entries = iter(entries)
+        window = self.max_workers * 2
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="qemu-probe") as executor:
+            pending = {}
+            
+            def fill():
+                while len(pending) < window:
+                    try:
+                        path, st = next(entries)
+                    except StopIteration:
+                        return
+                    pending[executor.submit(self._probe, path, st)] = path
+            
+            try:
+                fill()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path = pending.pop(future)
+                        try:
+                            yield path, future.result(), None
+                        except Exception as e:
+                            yield path, None, e
+                    fill()
+            finally:
+                # Consumer stopped early: drop probes that have not started yet
+                for future in pending:
+                    future.cancel()
+
+
+class AllocationSummary:
+    """Where the guest-visible bytes of an image live, from its allocation map
+    
+    data is allocated in the image itself and backing in a backing file;
+    zero is allocated in some layer but reads as zeros; unallocated is
+    allocated in no layer at all (qcow2 clusters never written, holes in
+    sparse raw files).
+    """
+    
+    __slots__ = ("data", "zero", "backing", "unallocated", "extents")
+    
+    FIELDS = __slots__
+    
+    def __init__(self, data=0, zero=0, backing=0, unallocated=0, extents=0):
+        self.data = data
+        self.zero = zero
+        self.backing = backing
+        self.unallocated = unallocated
+        self.extents = extents
+    
+    @property
+    def virtual_size(self):
+        return self.data + self.zero + self.backing + self.unallocated
+    
+    @property
+    def data_ratio(self):
+        """Fraction of the virtual size that is data in the image itself"""
+        total = self.virtual_size
+        return self.data / total if total else 0.0
+    
+    def add(self, extent):
+        """Count one qemu-img map extent
+        
+        qemu-img also reports unallocated areas as zero, so present is
+        checked first.
+        
+        >>> summary = AllocationSummary()
+        >>> for extent in [
+        ...         {"length": 4, "depth": 0, "present": True, "zero": False, "data": True},
+        ...         {"length": 2, "depth": 0, "present": True, "zero": True, "data": False},
+        ...         {"length": 3, "depth": 1, "present": True, "zero": False, "data": True},
+        ...         {"length": 1, "depth": 1, "present": True, "zero": True, "data": False},
+        ...         {"length": 8, "depth": 0, "present": False, "zero": True, "data": False},
+        ...         {"length": 5, "depth": 1, "present": False, "zero": True, "data": False}]:
+        ...     summary.add(extent)
+        >>> summary.to_dict()
+        {'data': 4, 'zero': 3, 'backing': 3, 'unallocated': 13, 'extents': 6}
+        """
+        length = extent["length"]
+        if not extent.get("present", True):
+            self.unallocated += length
+        elif extent.get("zero"):
+            self.zero += length
+        elif extent.get("depth", 0) == 0:
+            self.data += length
+        else:
+            self.backing += length
+        self.extents += 1
+    
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+    
+    def __str__(self):
+        return (f"{format_size(self.data)} data, {format_size(self.zero)} zero, "
+                f"{format_size(self.backing)} from backing, "
+                f"{format_size(self.unallocated)} unallocated ({self.extents} extents)")
+
+
+def map_allocation(file_path, stop=None):
+    """Summarize an image's allocation map with qemu-img map
+    
+    stop is an optional callable checked between extents; returning True
+    abandons the map and returns None.
+    """
+    summary = AllocationSummary()
+    extents = iter_qemu_map(file_path)
+    with metrics.span("qemu-img map"):
+        try:
+            for extent in extents:
+                if stop is not None and stop():
+                    return None
+                summary.add(extent)
+        finally:
+            extents.close()
+    return summary
+
+
+class DiskRecord:
+    """One disk image and its probed metadata; slotted so large inventories stay compact
+    
+    Sizes are byte counts, or None when unknown. backing_chain holds the
+    resolved backing files, nearest first. allocation is the image's
+    AllocationSummary once it has been analyzed, check its latest
+    CheckResult and snapshots its internal Snapshots once listed.
+    """
+    
+    __slots__ = ("filename", "full_path", "format", "virtual_size", "actual_size",
+                 "cluster_size", "dirty", "backing_file", "backing_chain", "key", "allocation",
+                 "check", "snapshots")
+    
+    # Fields saved by to_dict() and the probe cache
+    FIELDS = ("format", "virtual_size", "actual_size", "cluster_size", "dirty",
+              "backing_file", "backing_chain")
+    
+    def __init__(self, full_path, format="Unknown", virtual_size=None, actual_size=None,
+                 cluster_size=None, dirty=False, backing_file="", backing_chain=(),
+                 allocation=None, check=None, snapshots=None):
+        self.filename = os.path.basename(full_path)
+        self.full_path = full_path
+        self.format = format
+        self.virtual_size = virtual_size
+        self.actual_size = actual_size
+        self.cluster_size = cluster_size
+        self.dirty = dirty
+        self.backing_file = backing_file
+        self.backing_chain = tuple(backing_chain)
+        self.key = normalize_path(full_path)
+        self.allocation = allocation
+        self.check = check
+        self.snapshots = tuple(snapshots) if snapshots is not None else None
+    
+    @property
+    def size(self):
+        """Virtual size for display (e.g. "20 GiB")"""
+        return format_size(self.virtual_size) if self.virtual_size is not None else "Unknown"
+    
+    @property
+    def disk_size(self):
+        """Host allocation for display"""
+        return format_size(self.actual_size) if self.actual_size is not None else ""
+    
+    @property
+    def data_size(self):
+        """Data allocated in the image itself, from its allocation map, for display"""
+        return format_size(self.allocation.data) if self.allocation is not None else ""
+    
+    @property
+    def data_percent(self):
+        """Data as a share of the virtual size, for display"""
+        if self.allocation is None:
+            return ""
+        return f"{self.allocation.data_ratio * 100:.1f}%"
+    
+    @property
+    def check_status(self):
+        """Result of the latest integrity check, for display"""
+        return self.check.summary() if self.check is not None else ""
+    
+    @property
+    def snapshot_count(self):
+        """Number of internal snapshots for display, empty until they are listed"""
+        return str(len(self.snapshots)) if self.snapshots is not None else ""
+    
+    def to_dict(self):
+        """Plain dictionary of the record, for JSON output"""
+        data = {"filename": self.filename, "full_path": self.full_path}
+        for name in self.FIELDS:
+            data[name] = getattr(self, name)
+        data["backing_chain"] = list(self.backing_chain)
+        data["allocation"] = self.allocation.to_dict() if self.allocation is not None else None
+        data["check"] = self.check.to_dict() if self.check is not None else None
+        data["snapshots"] = ([snapshot.to_dict() for snapshot in self.snapshots]
+                             if self.snapshots is not None else None)
+        return data
+    
+    def update_from(self, other):
+        """Copy the metadata of another record for the same path"""
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+    
+    def same_disk(self, other):
+        """True if both records describe the same file with the same metadata"""
+        return (self.key == other.key and self.filename == other.filename and
+                self.virtual_size == other.virtual_size and self.format == other.format)
+
+
+def chain_key(path):
+    """Graph key for a backing file: normalized, unless it is a protocol or json: spec"""
+    if "://" in path or path.startswith("json:"):
+        return path
+    return normalize_path(path)
+
+
+class BackingGraph:
+    """Backing-file dependency graph over registered disk records
+    
+    Each overlay links to its direct backing file, taken from the record's
+    already probed backing_chain, so the graph is kept up to date one record
+    at a time and never runs qemu-img. Backing files that were not scanned
+    still appear as parents, they just have no record.
+    """
+    
+    def __init__(self):
+        self._records = {}  # key -> record
+        self._parent = {}  # overlay key -> backing file key
+        self._children = {}  # backing file key -> set of overlay keys
+        self._missing = {}  # parent key -> exists on disk, for parents without a record
+    
+    def __len__(self):
+        return len(self._records)
+    
+    def add(self, record):
+        """Link a record to its backing file"""
+        self._records[record.key] = record
+        self._missing.pop(record.key, None)
+        if record.backing_chain:
+            parent = chain_key(record.backing_chain[0])
+            self._parent[record.key] = parent
+            self._children.setdefault(parent, set()).add(record.key)
+    
+    def remove(self, record):
+        """Unlink a record (its own overlays stay linked to it by path)"""
+        if self._records.get(record.key) is not record:
+            return
+        del self._records[record.key]
+        parent = self._parent.pop(record.key, None)
+        if parent is not None:
+            children = self._children[parent]
+            children.discard(record.key)
+            if not children:
+                del self._children[parent]
+    
+    def clear(self):
+        self._records.clear()
+        self._parent.clear()
+        self._children.clear()
+        self._missing.clear()
+    
+    def record(self, path):
+        """Return the record for a path, or None if it was not scanned"""
+        return self._records.get(chain_key(path))
+    
+    def parent(self, path):
+        """Key of the direct backing file of an image, or None"""
+        return self._parent.get(chain_key(path))
+    
+    def children(self, path):
+        """Keys of the overlays that use an image as their direct backing file"""
+        return sorted(self._children.get(chain_key(path), ()))
+    
+    def dependents(self, path):
+        """Keys of every overlay that depends on an image, directly or through others"""
+        found = []
+        seen = set()
+        stack = [chain_key(path)]
+        while stack:
+            for child in self._children.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    found.append(child)
+                    stack.append(child)
+        return found
+    
+    def chain(self, path):
+        """Backing chain of an image, nearest backing file first"""
+        record = self.record(path)
+        if record is not None:
+            return record.backing_chain
+        # Not scanned itself: follow whatever part of the chain was scanned
+        chain = []
+        key = self._parent.get(chain_key(path))
+        while key is not None and key not in chain and len(chain) < MAX_BACKING_CHAIN:
+            chain.append(key)
+            key = self._parent.get(key)
+        return tuple(chain)
+    
+    def depth(self, path):
+        """Number of backing files below an image (0 for a standalone image)"""
+        return len(self.chain(path))
+    
+    def _exists(self, key):
+        # Scanned images exist; others are checked on disk once and remembered
+        if key in self._records:
+            return True
+        exists = self._missing.get(key)
+        if exists is None:
+            exists = "://" in key or key.startswith("json:") or os.path.exists(key)
+            self._missing[key] = exists
+        return exists
+    
+    def bases(self):
+        """Keys of existing images that have overlays but no backing file of their own"""
+        return sorted(key for key in self._children
+                      if key not in self._parent and self._exists(key))
+    
+    def orphans(self):
+        """Records of overlays whose backing file no longer exists"""
+        return [self._records[key] for key, parent in self._parent.items()
+                if not self._exists(parent)]
+    
+    def summary(self):
+        """Counts for the whole graph: overlays, bases, orphans and the deepest chain"""
+        deepest = max(self._records.values(), key=lambda r: len(r.backing_chain), default=None)
+        return {
+            "images": len(self._records),
+            "overlays": len(self._parent),
+            "bases": len(self.bases()),
+            "orphans": len(self.orphans()),
+            "max_depth": len(deepest.backing_chain) if deepest is not None else 0,
+            "deepest": deepest.full_path if deepest is not None and deepest.backing_chain else "",
+        }
+
+
+class DiskIndex:
+    """Sort and search indexes over the records of a DiskRegistry
+    
+    Each column in COLUMNS gets a sorted index of (key, serial, record)
+    entries the first time it is read. Later additions, removals and
+    changes are queued and merged on the next read, so a scan adding
+    thousands of records costs one merge per read instead of one sort per
+    record. Search is a case-insensitive substring match on the full path
+    (which includes the filename) over lowercased copies kept with the
+    records; a query that extends the previous one only re-checks its
+    matches. A query starting with ^ matches filename prefixes by bisecting
+    the filename index.
+    """
+    
+    # Sort key per column; unknown values sort first
+    COLUMNS = {
+        "filename": lambda record: record.filename.lower(),
+        "size": lambda record: record.virtual_size if record.virtual_size is not None else -1,
+        "allocated": lambda record: record.actual_size if record.actual_size is not None else -1,
+        "data": lambda record: record.allocation.data if record.allocation is not None else -1,
+        "data_percent": lambda record: (record.allocation.data_ratio
+                                        if record.allocation is not None else -1.0),
+        "format": lambda record: (record.format or "").lower(),
+        "check": lambda record: ((record.check.corruptions, record.check.leaks, record.check.status)
+                                 if record.check is not None else (-1, -1, "")),
+        "snapshots": lambda record: len(record.snapshots) if record.snapshots is not None else -1,
+        "path": lambda record: record.full_path.lower(),
+    }
+    
+    # Queued changes above this many are merged with a sort instead of one insort each
+    MERGE_THRESHOLD = 64
+    
+    def __init__(self):
+        self._serials = {}  # Record -> insertion serial, in insertion order
+        self._next_serial = 0
+        self._sorted = {}  # Column -> sorted entries, for columns that have been read
+        self._stale = {}  # Column -> records whose entries must be dropped
+        self._pending = {}  # Column -> records whose entries must be (re)inserted
+        self._orders = {}  # (column, reverse) -> record list, until the next change
+        self._paths = None  # (lowercased path, record) in insertion order, built on first search
+        self._last_search = None  # (query, matches) of the latest substring search
+    
+    def __len__(self):
+        return len(self._serials)
+    
+    def add(self, record):
+        """Index a newly registered record"""
+        self._serials[record] = self._next_serial
+        self._next_serial += 1
+        for pending in self._pending.values():
+            pending[record] = None
+        if self._paths is not None:
+            self._paths.append((record.full_path.lower(), record))
+        self._orders.clear()
+        self._last_search = None
+    
+    def remove(self, record):
+        """Drop a record from every index"""
+        if self._serials.pop(record, None) is None:
+            return
+        for column in self._sorted:
+            self._stale[column].add(record)
+            self._pending[column].pop(record, None)
+        self._paths = None
+        self._orders.clear()
+        self._last_search = None
+    
+    def changed(self, record):
+        """Re-sort a record whose metadata changed in place"""
+        if record not in self._serials:
+            return
+        for column in self._sorted:
+            self._stale[column].add(record)
+            self._pending[column][record] = None
+        self._orders.clear()
+        # The path never changes, so search results stay valid
+    
+    def clear(self):
+        """Drop every record"""
+        self.__init__()
+    
+    def _entries(self, column):
+        """The up-to-date sorted entries of a column"""
+        key = self.COLUMNS[column]
+        entries = self._sorted.get(column)
+        if entries is None:
+            entries = sorted((key(record), serial, record)
+                             for record, serial in self._serials.items())
+            self._sorted[column] = entries
+            self._stale[column] = set()
+            self._pending[column] = {}
+            return entries
+        
+        stale = self._stale[column]
+        if stale:
+            entries = [entry for entry in entries if entry[2] not in stale]
+            stale.clear()
+        pending = self._pending[column]
+        if pending:
+            added = [(key(record), self._serials[record], record) for record in pending]
+            pending.clear()
+            if len(added) <= self.MERGE_THRESHOLD:
+                for entry in added:
+                    bisect.insort(entries, entry)
+            else:
+                # Two sorted runs: Timsort merges them in linear time
+                added.sort()
+                entries.extend(added)
+                entries.sort()
+        self._sorted[column] = entries
+        return entries
+    
+    def order(self, column=None, reverse=False):
+        """Records sorted by a column, or in insertion order when column is None
+        
+        The list is shared until the next change; copy it before modifying.
+        """
+        records = self._orders.get((column, reverse))
+        if records is None:
+            if column is None:
+                records = list(self._serials)
+            else:
+                records = [entry[2] for entry in self._entries(column)]
+            if reverse:
+                records.reverse()
+            self._orders[(column, reverse)] = records
+        return records
+    
+    def search(self, query):
+        """Records matching a query, in insertion order (^text matches filename prefixes)"""
+        if query.startswith("^"):
+            prefix = query[1:].lower()
+            entries = self._entries("filename")
+            matches = set()
+            for index in range(bisect.bisect_left(entries, (prefix,)), len(entries)):
+                if not entries[index][0].startswith(prefix):
+                    break
+                matches.add(entries[index][2])
+            return [record for record in self._serials if record in matches]
+        
+        query = query.lower()
+        if self._last_search is not None and self._last_search[0] in query:
+            # Anything matching the longer query also matched the shorter one
+            candidates = self._last_search[1]
+        else:
+            if self._paths is None:
+                self._paths = [(record.full_path.lower(), record) for record in self._serials]
+            candidates = self._paths
+        # Reuse the stored pairs; allocating new ones per keystroke wakes the garbage collector
+        matches = [item for item in candidates if query in item[0]]
+        self._last_search = (query, matches)
+        return [item[1] for item in matches]
+    
+    def select(self, query="", column=None, reverse=False):
+        """Records matching query (all when empty), sorted by column"""
+        if not query:
+            return list(self.order(column, reverse))
+        matches = self.search(query)
+        if column is None:
+            if reverse:
+                matches.reverse()
+            return matches
+        if len(matches) * 16 < len(self._serials):
+            # Few matches: sorting them is cheaper than walking the whole column
+            key = self.COLUMNS[column]
+            serials = self._serials
+            return sorted(matches, key=lambda record: (key(record), serials[record]),
+                          reverse=reverse)
+        matches = set(matches)
+        return [record for record in self.order(column, reverse) if record in matches]
+
+
+class DiskRegistry:
+    """Disk records indexed by normalized path
+    
+    Lookups, inserts and removals are O(1); iteration follows insertion
+    order. graph is the backing-chain index of the registered records and
+    index their sort and search index.
+    """
+    
+    def __init__(self):
+        self._by_key = {}
+        self.graph = BackingGraph()
+        self.index = DiskIndex()
+        self.total_virtual = 0  # Sum of known virtual sizes, in bytes
+        self.total_actual = 0  # Sum of known host allocations, in bytes
+    
+    def __len__(self):
+        return len(self._by_key)
+    
+    def __iter__(self):
+        return iter(list(self._by_key.values()))
+    
+    def __contains__(self, path):
+        return normalize_path(path) in self._by_key
+    
+    def get(self, path):
+        """Return the record for a path, or None"""
+        return self._by_key.get(normalize_path(path))
+    
+    def add(self, record):
+        """Add a record; returns False if its path is already registered"""
+        if record.key in self._by_key:
+            return False
+        self._by_key[record.key] = record
+        self._count(record, 1)
+        self.graph.add(record)
+        self.index.add(record)
+        return True
+    
+    def update(self, record, new_record):
+        """Replace a registered record's metadata in place, keeping totals right"""
+        self._count(record, -1)
+        self.graph.remove(record)
+        record.update_from(new_record)
+        self._count(record, 1)
+        self.graph.add(record)
+        self.index.changed(record)
+    
+    def changed(self, record):
+        """Tell the indexes that a record's allocation or check result was updated in place"""
+        self.index.changed(record)
+    
+    def remove(self, record):
+        """Remove a record; returns False if it was not registered"""
+        if self._by_key.pop(record.key, None) is None:
+            return False
+        self._count(record, -1)
+        self.graph.remove(record)
+        self.index.remove(record)
+        return True
+    
+    def clear(self):
+        """Remove every record"""
+        self._by_key.clear()
+        self.graph.clear()
+        self.index.clear()
+        self.total_virtual = 0
+        self.total_actual = 0
+    
+    def _count(self, record, sign):
+        self.total_virtual += sign * (record.virtual_size or 0)
+        self.total_actual += sign * (record.actual_size or 0)
+
+
+class ScanProgress:
+    """Running counters for a folder scan, reported from the worker thread"""
+    
+    def __init__(self):
+        self.found = 0
+        self.probed = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.walking = True
+        self.started = time.monotonic()
+        self.finished = None  # Set when the scan is over
+        self.error = ""
+    
+    def snapshot(self):
+        """Return a copy that is safe to hand over to the GUI thread"""
+        copy = ScanProgress()
+        copy.__dict__.update(self.__dict__)
+        return copy
+    
+    def elapsed(self):
+        """Seconds since the scan started, or how long it took once finished"""
+        return (self.finished or time.monotonic()) - self.started
+    
+    def rate(self):
+        """Probes completed per second since the scan started"""
+        elapsed = self.elapsed()
+        return self.probed / elapsed if elapsed > 0 else 0.0
+    
+    def eta(self):
+        """Estimated seconds left, or None while the file count is still growing"""
+        rate = self.rate()
+        if self.walking or rate <= 0:
+            return None
+        return max(0.0, (self.found - self.probed) / rate)
+    
+    def __str__(self):
+        text = f"Scanning: {self.found} found, {self.probed} probed ({self.rate():.1f}/s"
+        eta = self.eta()
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            text += f", ETA {minutes}:{seconds:02d}"
+        return text + ")"
+
+
+def scan_disks(folder, probe=probe_disk, max_workers=DEFAULT_PROBE_WORKERS,
+               progress=None, stop=None):
+    """Walk a folder and probe every disk image in it in parallel
+    
+    Yields a DiskRecord for each image as soon as its probe
+    finishes; files that fail to probe are counted in progress and skipped.
+    progress is an optional ScanProgress updated in place, and stop an
+    optional callable that ends the scan early when it returns True.
+    """
+    if progress is None:
+        progress = ScanProgress()
+    
+    def walk():
+        # Hand each file to the probers as soon as it is found
+        for entry in iter_disk_files(folder, stop=stop):
+            progress.found += 1
+            yield entry
+        progress.walking = False
+    
+    prober = DiskProber(max_workers=max_workers, probe=probe)
+    for file_path, record, error in prober.probe_all(walk()):
+        if stop is not None and stop():
+            return
+        progress.probed += 1
+        if error is not None:
+            # Skip files that aren't valid QEMU disk images or failed to probe
+            progress.failed += 1
+        else:
+            yield record
+
+
+def default_config_path():
+    """Location of the saved scan roots"""
+    base = (os.environ.get("APPDATA") or os.environ.get("XDG_CONFIG_HOME")
+            or os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(base, "qemu-disk-manager", "scan_roots.json")
+
+
+class ScanRoot:
+    """A saved folder to scan and how many probes may run against it at once"""
+    
+    __slots__ = ("path", "workers", "enabled")
+    
+    def __init__(self, path, workers=DEFAULT_PROBE_WORKERS, enabled=True):
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.enabled = bool(enabled)
+    
+    def to_dict(self):
+        return {"path": self.path, "workers": self.workers, "enabled": self.enabled}
+
+
+def load_scan_roots(config_path=None):
+    """Read the saved scan roots; a missing file means none are saved
+    
+    Raises ValueError if the file is not a valid list of roots.
+    """
+    try:
+        with open(config_path or default_config_path(), encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    try:
+        return [ScanRoot(item["path"], item.get("workers", DEFAULT_PROBE_WORKERS),
+                         item.get("enabled", True)) for item in data]
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError(f"invalid scan roots file: {e}")
+
+
+def save_scan_roots(roots, config_path=None):
+    """Save the scan roots, replacing the file only once it is fully written"""
+    config_path = config_path or default_config_path()
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    temp_path = config_path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump([root.to_dict() for root in roots], f, indent=2)
+    os.replace(temp_path, config_path)
+
+
+def unique_roots(roots):
+    """Drop roots naming a folder already in the list (by normalized path), keeping the first"""
+    seen = set()
+    unique = []
+    for root in roots:
+        key = normalize_path(root.path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(root)
+    return unique
+
+
+def scan_roots(roots, probe=probe_disk, progress=None, stop=None):
+    """Scan several roots at once and yield (root, record) as results arrive from any of them
+    
+    Each root is a shard with its own walker thread and a probe pool of
+    root.workers, so a slow network mount only ever delays its own
+    results. A folder given twice is scanned once (see unique_roots).
+    progress, if given, is a dict that receives one ScanProgress per root
+    path (with finished and error set when the shard ends); stop is an
+    optional callable that ends every shard.
+    """
+    roots = unique_roots(roots)
+    if progress is None:
+        progress = {}
+    results = queue.Queue()
+    halt = threading.Event()  # Set when the consumer stops early
+    
+    def shard_stop():
+        return halt.is_set() or (stop is not None and stop())
+    
+    def shard(root, shard_progress):
+        try:
+            if not os.path.isdir(root.path):
+                shard_progress.error = "not a folder"
+                return
+            with metrics.span("scan root", root=root.path):
+                for record in scan_disks(root.path, probe=probe, max_workers=root.workers,
+                                         progress=shard_progress, stop=shard_stop):
+                    results.put((root, record))
+        except Exception as e:
+            shard_progress.error = str(e)
+        finally:
+            shard_progress.walking = False
+            shard_progress.finished = time.monotonic()
+            results.put((root, None))
+    
+    threads = []
+    for index, root in enumerate(roots):
+        progress[root.path] = ScanProgress()
+        threads.append(threading.Thread(target=shard, args=(root, progress[root.path]),
+                                        name=f"scan-shard-{index}", daemon=True))
+    for thread in threads:
+        thread.start()
+    
+    try:
+        remaining = len(threads)
+        while remaining:
+            root, record = results.get()
+            if record is None:
+                remaining -= 1
+            else:
+                yield root, record
+    finally:
+        halt.set()
+
+
+class _Inotify:
+    """Minimal ctypes binding for Linux inotify"""
+    
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct("iIII")
+    
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._ctypes = ctypes
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    
+    def add_watch(self, path):
+        """Watch a directory and return its watch descriptor"""
+        wd = self._add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+    
+    def read_events(self):
+        """Return the queued (wd, mask, name) events without blocking"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class DiskWatcher:
+    """Watch a folder tree and report disk images that are added, changed or removed
+    
+    Uses inotify on Linux, so an idle folder costs nothing, and falls back to
+    polling with a single-pass walk elsewhere (or when inotify runs out of
+    watches). Events are debounced: a file is reported only after it has had
+    no events for `settle` seconds, so an image that is still being written
+    is probed once, when it is done.
+    """
+    
+    def __init__(self, folder, settle=2.0, poll_interval=10.0, use_inotify=True,
+                 extensions=DISK_EXTENSIONS, exclude_dirs=EXCLUDED_DIRS):
+        self.folder = folder
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.extensions = extensions
+        self.exclude_dirs = exclude_dirs
+        self.mode = None  # "inotify" or "polling" once running
+        self._known = {}  # path -> (size, mtime_ns) of the last reported version
+        self._pending = {}  # path -> (due time, signature when queued or None)
+        self._stopped = threading.Event()
+        self._wake_lock = threading.Lock()  # Guards the wake pipe against stop() after close
+        self._wake_r = self._wake_w = -1  # Wake pipe, open only while run() is running
+    
+    @staticmethod
+    def _signature(st):
+        return (st.st_size, st.st_mtime_ns)
+    
+    def stop(self):
+        """Make run() return; safe to call from any thread"""
+        self._stopped.set()
+        with self._wake_lock:
+            # Outside run() there is no pipe, and old fd numbers may have been reused
+            if self._wake_w < 0:
+                return
+            try:
+                os.write(self._wake_w, b"x")
+            except OSError:
+                pass
+    
+    def run(self, on_changes):
+        """Watch until stop() is called
+        
+        on_changes(changed, removed) is called from this thread with a list
+        of (path, stat_result) for new or modified images and a list of
+        removed paths, once they have settled.
+        """
+        with self._wake_lock:
+            self._wake_r, self._wake_w = os.pipe()
+        inotify = None
+        try:
+            if self.use_inotify:
+                try:
+                    inotify = _Inotify()
+                except (OSError, AttributeError):
+                    inotify = None
+            if inotify is not None:
+                try:
+                    self._run_inotify(inotify, on_changes)
+                    return
+                except OSError:
+                    # Usually the inotify watch limit; keep going by polling
+                    pass
+            self._run_polling(on_changes)
+        finally:
+            if inotify is not None:
+                inotify.close()
+            with self._wake_lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_r = self._wake_w = -1
+    
+    def _walk(self, folder, on_dir=None):
+        """Map every image under folder to its signature"""
+        return {path: self._signature(st) for path, st in
+                iter_disk_files(folder, self.extensions, self.exclude_dirs, on_dir=on_dir)}
+    
+    def _queue(self, path, signature=None, now=None):
+        now = time.monotonic() if now is None else now
+        self._pending[path] = (now + self.settle, signature)
+    
+    def _settle(self, on_changes):
+        """Report pending paths whose quiet period is over"""
+        now = time.monotonic()
+        changed = []
+        removed = []
+        for path, (due, signature) in list(self._pending.items()):
+            if due > now:
+                continue
+            del self._pending[path]
+            try:
+                st = os.stat(path)
+            except OSError:
+                if self._known.pop(path, None) is not None:
+                    removed.append(path)
+                continue
+            current = self._signature(st)
+            if signature is not None and current != signature:
+                # Still changing since it was queued; wait for another quiet period
+                self._queue(path, current, now)
+            elif current != self._known.get(path):
+                self._known[path] = current
+                changed.append((path, st))
+        if changed or removed:
+            on_changes(changed, removed)
+    
+    def _next_timeout(self, idle_timeout):
+        if not self._pending:
+            return idle_timeout
+        return max(0.0, min(due for due, _ in self._pending.values()) - time.monotonic())
+    
+    def _run_polling(self, on_changes):
+        self.mode = "polling"
+        self._known = self._walk(self.folder)
+        next_poll = time.monotonic() + self.poll_interval
+        
+        while not self._stopped.is_set():
+            timeout = min(self._next_timeout(self.poll_interval),
+                          max(0.0, next_poll - time.monotonic()))
+            if self._stopped.wait(timeout):
+                return
+            if time.monotonic() >= next_poll:
+                current = self._walk(self.folder)
+                for path, signature in current.items():
+                    if signature != self._known.get(path) and path not in self._pending:
+                        self._queue(path, signature)
+                for path in self._known.keys() - current.keys():
+                    if path not in self._pending:
+                        self._queue(path)
+                next_poll = time.monotonic() + self.poll_interval
+            self._settle(on_changes)
+    
+    def _run_inotify(self, inotify, on_changes):
+        watches = {}  # wd -> directory
+        
+        def watch_tree(folder):
+            def add(directory):
+                watches[inotify.add_watch(directory)] = directory
+            return self._walk(folder, on_dir=add)
+        
+        self._known = watch_tree(self.folder)
+        self.mode = "inotify"
+        
+        while not self._stopped.is_set():
+            ready, _, _ = select.select([inotify.fd, self._wake_r], [], [],
+                                       self._next_timeout(None))
+            if self._stopped.is_set():
+                return
+            
+            for wd, mask, name in inotify.read_events() if inotify.fd in ready else ():
+                if mask & _Inotify.IN_Q_OVERFLOW:
+                    # Events were lost: re-check everything we know and everything on disk
+                    for path in set(self._known) | set(self._walk(self.folder)):
+                        self._queue(path)
+                    continue
+                if mask & _Inotify.IN_IGNORED:
+                    watches.pop(wd, None)
+                    continue
+                directory = watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                
+                if mask & _Inotify.IN_ISDIR:
+                    if name in self.exclude_dirs:
+                        continue
+                    if mask & (_Inotify.IN_CREATE | _Inotify.IN_MOVED_TO):
+                        # New subtree: watch it and pick up any images already inside
+                        for image in watch_tree(path):
+                            self._queue(image)
+                    elif mask & (_Inotify.IN_DELETE | _Inotify.IN_MOVED_FROM):
+                        prefix = path + os.sep
+                        for image in [p for p in self._known if p.startswith(prefix)]:
+                            self._queue(image)
+                elif name.lower().endswith(self.extensions):
+                    self._queue(path)
+            
+            self._settle(on_changes)
+
+
+SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def is_valid_size(size):
+    """True for qemu-img sizes like 20G, 100M or 1T"""
+    return len(size) > 1 and size[:-1].isdigit() and size[-1] in SIZE_UNITS
+
+
+def parse_size(size):
+    """Byte count of a qemu-img size like 20G or 4096, or None if it can't be parsed"""
+    size = size.strip().upper()
+    if size.isdigit():
+        return int(size)
+    if is_valid_size(size):
+        return int(size[:-1]) * SIZE_UNITS[size[-1]]
+    return None
+
+
+def create_disk_image(file_path, disk_format, size):
+    """Create a virtual disk with qemu-img create and return its DiskRecord
+    
+    Raises subprocess.CalledProcessError if qemu-img fails and
+    FileNotFoundError if qemu-img is not installed.
+    """
+    cmd = ["qemu-img", "create", "-f", disk_format, file_path, size]
+    metrics.count("subprocess: qemu-img create")
+    with metrics.span("qemu-img create"):
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return DiskRecord(file_path, disk_format, virtual_size=parse_size(size))
+
+
+MANIFEST_FIELDS = ("path", "format", "size", "preallocation", "cluster_size",
+                   "backing_file", "backing_format")
+CREATE_FORMATS = ("qcow2", "raw")
+# qemu-img create -o preallocation values each format accepts
+PREALLOCATION_MODES = {"qcow2": ("off", "metadata", "falloc", "full"),
+                       "raw": ("off", "falloc", "full")}
+
+
+class CreateJob:
+    """One qemu-img create job from a provisioning manifest"""
+    
+    __slots__ = MANIFEST_FIELDS
+    
+    def __init__(self, path, format="qcow2", size="", preallocation="", cluster_size="",
+                 backing_file="", backing_format=""):
+        self.path = path
+        self.format = format
+        self.size = size
+        self.preallocation = preallocation
+        self.cluster_size = cluster_size
+        self.backing_file = backing_file
+        self.backing_format = backing_format
+    
+    def command(self):
+        """The qemu-img create command line for this job"""
+        cmd = ["qemu-img", "create", "-f", self.format]
+        if self.backing_file:
+            cmd += ["-b", self.backing_file]
+            # Newer qemu-img refuses to guess the backing format
+            cmd += ["-F", self.backing_format or "qcow2"]
+        options = []
+        if self.preallocation:
+            options.append(f"preallocation={self.preallocation}")
+        if self.cluster_size:
+            options.append(f"cluster_size={self.cluster_size}")
+        if options:
+            cmd += ["-o", ",".join(options)]
+        cmd.append(self.path)
+        if self.size:
+            cmd.append(self.size)
+        return cmd
+    
+    def record(self):
+        """DiskRecord for the created image"""
+        return DiskRecord(self.path, self.format,
+                          virtual_size=parse_size(self.size) if self.size else None,
+                          backing_file=self.backing_file,
+                          backing_chain=follow_backing_chain(self.path, self.backing_file))
+
+
+class CreateResult:
+    """Outcome of one batch create job"""
+    
+    __slots__ = ("job", "status", "message", "seconds")
+    
+    # Status values
+    CREATED = "created"
+    FAILED = "failed"
+    ROLLED_BACK = "rolled back"
+    NOT_RUN = "not run"
+    DRY_RUN = "dry run"
+    
+    def __init__(self, job, status, message="", seconds=0.0):
+        self.job = job
+        self.status = status
+        self.message = message
+        self.seconds = seconds
+    
+    def __str__(self):
+        text = f"{self.status:<12} {self.job.path}"
+        if self.seconds:
+            text += f" ({self.seconds:.2f}s)"
+        if self.message:
+            text += f": {self.message}"
+        return text
+
+
+def _read_manifest_rows(manifest_path):
+    """Read raw manifest rows (dictionaries) from a CSV, JSON or YAML file"""
+    extension = os.path.splitext(manifest_path)[1].lower()
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            return list(csv.DictReader(f))
+        if extension == ".json":
+            data = json.load(f)
+        elif extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("YAML manifests need PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unsupported manifest type '{extension}' (use .csv, .json or .yaml)")
+    
+    # Accept either a bare list of rows or {"disks": [...]}
+    if isinstance(data, dict):
+        data = data.get("disks")
+    if not isinstance(data, list):
+        raise ValueError("Manifest must be a list of disks or contain a 'disks' list")
+    return data
+
+
+def load_manifest(manifest_path):
+    """Load and validate a provisioning manifest, returning a list of CreateJob
+    
+    Relative paths are resolved against the manifest's folder. Raises
+    ValueError naming the offending row if anything is invalid, so a bad
+    manifest never creates a partial batch.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    seen = set()
+    
+    for number, row in enumerate(_read_manifest_rows(manifest_path), start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Row {number}: expected a mapping of fields")
+        unknown = set(row) - set(MANIFEST_FIELDS)
+        if unknown:
+            raise ValueError(f"Row {number}: unknown field(s) {', '.join(sorted(unknown))}")
+        fields = {name: str(value).strip() for name, value in row.items() if value is not None}
+        
+        path = fields.get("path", "")
+        if not path:
+            raise ValueError(f"Row {number}: path is required")
+        fields["path"] = os.path.normpath(os.path.join(base, path))
+        fields["format"] = (fields.get("format") or "qcow2").lower()
+        fields["size"] = fields.get("size", "").upper()
+        fields["preallocation"] = fields.get("preallocation", "").lower()
+        
+        job = CreateJob(**fields)
+        if job.format not in CREATE_FORMATS:
+            raise ValueError(f"Row {number}: unsupported format '{job.format}'")
+        if job.size and not (job.size.isdigit() or is_valid_size(job.size)):
+            raise ValueError(f"Row {number}: invalid size '{job.size}'")
+        if not job.size and not job.backing_file:
+            raise ValueError(f"Row {number}: size is required without a backing file")
+        if job.backing_file and job.format != "qcow2":
+            raise ValueError(f"Row {number}: only qcow2 images can have a backing file")
+        if job.preallocation and job.preallocation not in PREALLOCATION_MODES[job.format]:
+            raise ValueError(f"Row {number}: preallocation '{job.preallocation}' is not valid "
+                             f"for {job.format} (use {', '.join(PREALLOCATION_MODES[job.format])})")
+        if job.cluster_size:
+            if job.format != "qcow2":
+                raise ValueError(f"Row {number}: only qcow2 images have a cluster size")
+            cluster_size = parse_size(job.cluster_size)
+            # qcow2 clusters are a power of two from 512 bytes to 2 MiB
+            if (cluster_size is None or not 512 <= cluster_size <= 2 << 20
+                    or cluster_size & (cluster_size - 1)):
+                raise ValueError(f"Row {number}: invalid cluster size '{job.cluster_size}'")
+        
+        key = normalize_path(job.path)
+        if key in seen:
+            raise ValueError(f"Row {number}: duplicate path {job.path}")
+        seen.add(key)
+        jobs.append(job)
+    
+    return jobs
+
+
+def _backing_path(job):
+    """Absolute path of a job's backing file
+    
+    Relative backing files are kept as written in the image (so the chain can
+    be moved as a whole) and, like qemu-img, resolved against its folder.
+    """
+    return os.path.join(os.path.dirname(job.path), job.backing_file)
+
+
+def _creation_waves(jobs):
+    """Group jobs so every overlay is created after its backing image in the batch"""
+    by_key = {normalize_path(job.path): job for job in jobs}
+    depth = {}
+    
+    def job_depth(job, visiting=()):
+        key = normalize_path(job.path)
+        if key not in depth:
+            parent = by_key.get(normalize_path(_backing_path(job))) if job.backing_file else None
+            if parent is None:
+                depth[key] = 0
+            elif key in visiting:
+                raise ValueError(f"Backing file loop at {job.path}")
+            else:
+                depth[key] = job_depth(parent, visiting + (key,)) + 1
+        return depth[key]
+    
+    waves = []
+    for job in jobs:
+        level = job_depth(job)
+        while len(waves) <= level:
+            waves.append([])
+        waves[level].append(job)
+    return waves
+
+
+def run_create_job(job):
+    """Run one create job and return its CreateResult"""
+    start = time.monotonic()
+    metrics.count("subprocess: qemu-img create")
+    try:
+        with metrics.span("qemu-img create"):
+            subprocess.run(job.command(), capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        return CreateResult(job, CreateResult.FAILED, e.stderr.strip(), time.monotonic() - start)
+    except OSError as e:
+        return CreateResult(job, CreateResult.FAILED, str(e), time.monotonic() - start)
+    return CreateResult(job, CreateResult.CREATED, "", time.monotonic() - start)
+
+
+def batch_create(jobs, max_workers=DEFAULT_PROBE_WORKERS, dry_run=False, rollback=True,
+                 on_result=None, stop=None):
+    """Create many disks with a bounded pool of parallel qemu-img create jobs
+    
+    Returns one CreateResult per job, in manifest order. Existing target
+    files are refused up front. With rollback, the first failure stops the
+    batch and every file it already created, including partial files left
+    by failed jobs, is removed again, so the batch is all-or-nothing. Overlays wait for backing images created in the same
+    batch. on_result, if given, is called with each result as it finishes;
+    stop is an optional callable that cancels the remaining jobs.
+    """
+    results = {}
+    
+    def finish(result):
+        results[id(result.job)] = result
+        if on_result is not None:
+            on_result(result)
+    
+    # Refuse to overwrite anything that already exists before starting any job
+    existing = [job for job in jobs if os.path.exists(job.path)]
+    if existing or dry_run:
+        for job in jobs:
+            if job in existing:
+                finish(CreateResult(job, CreateResult.FAILED, "file already exists"))
+            elif dry_run:
+                finish(CreateResult(job, CreateResult.DRY_RUN, " ".join(job.command())))
+            else:
+                finish(CreateResult(job, CreateResult.NOT_RUN, "batch refused"))
+        return [results[id(job)] for job in jobs]
+    
+    failed = False
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers)),
+                            thread_name_prefix="qemu-create") as executor:
+        for wave in _creation_waves(jobs):
+            if (failed and rollback) or (stop is not None and stop()):
+                break
+            futures = [executor.submit(run_create_job, job) for job in wave]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                failed = failed or result.status == CreateResult.FAILED
+                finish(result)
+                if (failed and rollback) or (stop is not None and stop()):
+                    # Don't start anything else; jobs already running still finish
+                    for other in futures:
+                        other.cancel()
+    
+    for job in jobs:
+        if id(job) not in results:
+            reason = "skipped after a failure" if failed and rollback else "cancelled"
+            finish(CreateResult(job, CreateResult.NOT_RUN, reason))
+    
+    if failed and rollback:
+        # All-or-nothing: remove what this batch created. Targets were checked
+        # up front, so anything at a failed job's path is a partial file of ours
+        for job in jobs:
+            result = results[id(job)]
+            if result.status == CreateResult.CREATED:
+                try:
+                    os.remove(job.path)
+                    result.status = CreateResult.ROLLED_BACK
+                except OSError as e:
+                    result.message = f"rollback failed: {e}"
+            elif result.status == CreateResult.FAILED:
+                try:
+                    os.remove(job.path)
+                    result.message += " (partial file removed)"
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    result.message += f" (rollback failed: {e})"
+    
+    return [results[id(job)] for job in jobs]
+
+
+CONVERT_FORMATS = ("qcow2", "raw")
+CONVERT_CACHE_MODES = ("writeback", "unsafe", "none", "writethrough", "directsync")
+CONVERT_PROGRESS = re.compile(r"\((\d+(?:\.\d+)?)/100%\)")
+
+
+def convert_target(source, output_format, output_dir=None):
+    """Default target path for converting source: same name, new extension"""
+    folder = output_dir or os.path.dirname(os.path.abspath(source))
+    stem = os.path.splitext(os.path.basename(source))[0]
+    target = os.path.join(folder, f"{stem}.{output_format}")
+    if normalize_path(target) == normalize_path(source):
+        target = os.path.join(folder, f"{stem}.converted.{output_format}")
+    return target
+
+
+def convert_sources(paths, output_format, output_dir=None):
+    """Split paths into (sources, skipped), leaving out what an earlier convert wrote
+    
+    A path counts as an earlier output when another path converts to it
+    (see convert_target) and it is not older than that source, so
+    converting a whole folder again does not convert its own results.
+    skipped is a list of (path, source it was converted from) pairs.
+    """
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[normalize_path(path)] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    
+    origins = {}  # normalized output path -> source
+    for path in paths:
+        source_mtime = mtimes.get(normalize_path(path))
+        target = normalize_path(convert_target(path, output_format, output_dir))
+        if source_mtime is not None and mtimes.get(target, -1) >= source_mtime:
+            origins[target] = path
+    
+    sources = []
+    skipped = []
+    for path in paths:
+        origin = origins.get(normalize_path(path))
+        if origin is None:
+            sources.append(path)
+        else:
+            skipped.append((path, origin))
+    return sources, skipped
+
+
+class ConvertJob:
+    """One qemu-img convert job
+    
+    compress (-c) needs a qcow2 target. coroutines (-m) is the number of
+    parallel coroutines qemu-img uses, out_of_order (-W) allows writes to
+    land out of order and cache (-t) is the target cache mode.
+    virtual_size, when known, is used to turn progress into throughput.
+    """
+    
+    __slots__ = ("source", "target", "format", "compress", "coroutines", "out_of_order",
+                 "cache", "source_size", "virtual_size")
+    
+    def __init__(self, source, target=None, format="qcow2", compress=False, coroutines=None,
+                 out_of_order=False, cache="", virtual_size=None):
+        if format not in CONVERT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(CONVERT_FORMATS)}")
+        if compress and format != "qcow2":
+            raise ValueError("compression needs a qcow2 target")
+        if coroutines is not None and not 1 <= int(coroutines) <= 16:
+            raise ValueError("coroutines must be between 1 and 16")
+        if cache and cache not in CONVERT_CACHE_MODES:
+            raise ValueError(f"cache must be one of {', '.join(CONVERT_CACHE_MODES)}")
+        
+        self.source = source
+        self.target = target or convert_target(source, format)
+        self.format = format
+        self.compress = compress
+        self.coroutines = int(coroutines) if coroutines is not None else None
+        self.out_of_order = out_of_order
+        self.cache = cache
+        try:
+            st = os.stat(source)
+        except OSError:
+            self.source_size = 0
+            self.virtual_size = virtual_size
+        else:
+            self.source_size = allocated_bytes(st)
+            self.virtual_size = virtual_size or st.st_size
+    
+    def command(self):
+        """The qemu-img convert command line for this job"""
+        cmd = ["qemu-img", "convert", "-p", "-O", self.format]
+        if self.compress:
+            cmd.append("-c")
+        if self.coroutines:
+            cmd += ["-m", str(self.coroutines)]
+        if self.out_of_order:
+            cmd.append("-W")
+        if self.cache:
+            cmd += ["-t", self.cache]
+        cmd += [self.source, self.target]
+        return cmd
+    
+    def cpu_cost(self, budget):
+        """Cores this job is expected to keep busy (compression runs per coroutine)"""
+        if not self.compress:
+            return 0
+        return min(self.coroutines or 8, budget)
+
+
+class ConvertResult:
+    """Outcome of one convert job"""
+    
+    __slots__ = ("job", "status", "message", "seconds", "target_size")
+    
+    # Status values
+    CONVERTED = "converted"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    NOT_RUN = "not run"
+    
+    def __init__(self, job, status, message="", seconds=0.0, target_size=0):
+        self.job = job
+        self.status = status
+        self.message = message
+        self.seconds = seconds
+        self.target_size = target_size  # Host bytes allocated to the target
+    
+    @property
+    def bytes_saved(self):
+        """Host bytes freed by the conversion (negative if the target is larger)"""
+        if self.status != self.CONVERTED:
+            return 0
+        return self.job.source_size - self.target_size
+    
+    @property
+    def rate(self):
+        """Average throughput in guest bytes per second"""
+        if self.status != self.CONVERTED or not self.seconds or not self.job.virtual_size:
+            return 0.0
+        return self.job.virtual_size / self.seconds
+    
+    def __str__(self):
+        text = f"{self.status:<10} {self.job.source} -> {self.job.target}"
+        if self.status == self.CONVERTED:
+            saved = self.bytes_saved
+            text += (f" ({self.seconds:.1f}s, {self.rate / 1e6:.1f} MB/s, "
+                     f"{'saved' if saved >= 0 else 'grew by'} {format_size(abs(saved))})")
+        if self.message:
+            text += f": {self.message}"
+        return text
+
+
+def run_convert_job(job, on_progress=None, stop=None):
+    """Run one convert job and return its ConvertResult
+    
+    on_progress(job, percent, bytes_per_second) is called from a reader
+    thread as qemu-img reports progress. stop is an optional callable;
+    when it returns True the conversion is killed. A failed or cancelled
+    conversion never leaves a partial target behind.
+    """
+    start = time.monotonic()
+    if os.path.exists(job.target):
+        return ConvertResult(job, ConvertResult.FAILED, "target already exists")
+    metrics.count("subprocess: qemu-img convert")
+    try:
+        proc = subprocess.Popen(job.command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, errors="replace")
+    except OSError as e:
+        return ConvertResult(job, ConvertResult.FAILED, str(e))
+    
+    errors = []
+    
+    def read_progress():
+        # -p rewrites one line with \r; text mode splits on it like a newline
+        for line in proc.stdout:
+            match = CONVERT_PROGRESS.search(line)
+            if match and on_progress is not None:
+                percent = float(match.group(1))
+                elapsed = time.monotonic() - start
+                done = (job.virtual_size or 0) * percent / 100
+                on_progress(job, percent, done / elapsed if elapsed > 0 else 0.0)
+    
+    readers = [threading.Thread(target=read_progress, daemon=True),
+               threading.Thread(target=lambda: errors.append(proc.stderr.read()), daemon=True)]
+    for reader in readers:
+        reader.start()
+    
+    cancelled = False
+    while True:
+        try:
+            proc.wait(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if stop is not None and stop():
+                cancelled = True
+                proc.kill()
+    for reader in readers:
+        reader.join()
+    seconds = time.monotonic() - start
+    
+    if cancelled or proc.returncode != 0:
+        try:
+            os.remove(job.target)
+        except OSError:
+            pass
+        if cancelled:
+            return ConvertResult(job, ConvertResult.CANCELLED, "", seconds)
+        return ConvertResult(job, ConvertResult.FAILED, "".join(errors).strip(), seconds)
+    
+    metrics.record("qemu-img convert", seconds)
+    try:
+        target_size = allocated_bytes(os.stat(job.target))
+    except OSError:
+        target_size = 0
+    return ConvertResult(job, ConvertResult.CONVERTED, "", seconds, target_size)
+
+
+def convert_all(jobs, max_jobs=2, cpu_budget=None, on_progress=None, on_result=None, stop=None):
+    """Run convert jobs in parallel under an I/O and a CPU budget
+    
+    At most max_jobs conversions run at once (the I/O budget), and
+    compressed jobs only start while their cpu_cost fits in cpu_budget
+    cores (default: all of them); uncompressed jobs are I/O bound and only
+    count against max_jobs. The largest sources start first so one big
+    image does not run alone at the end. Returns one ConvertResult per
+    job, in input order; callbacks are as for run_convert_job, and
+    on_result is called with each result as it finishes.
+    """
+    cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+    max_jobs = max(1, int(max_jobs))
+    results = {}
+    
+    def finish(result):
+        results[id(result.job)] = result
+        if on_result is not None:
+            on_result(result)
+    
+    pending = sorted(jobs, key=lambda job: job.source_size, reverse=True)
+    running = {}  # future -> job
+    cpu_used = 0
+    
+    with ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="qemu-convert") as executor:
+        while pending or running:
+            if stop is not None and stop():
+                for job in pending:
+                    finish(ConvertResult(job, ConvertResult.NOT_RUN, "cancelled"))
+                pending = []
+            
+            for job in list(pending):
+                if len(running) >= max_jobs:
+                    break
+                cost = job.cpu_cost(cpu_budget)
+                # A job that doesn't fit waits, unless nothing else is running
+                if running and cpu_used + cost > cpu_budget:
+                    continue
+                pending.remove(job)
+                cpu_used += cost
+                running[executor.submit(run_convert_job, job, on_progress, stop)] = job
+            
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                cpu_used -= job.cpu_cost(cpu_budget)
+                finish(future.result())
+    
+    return [results[id(job)] for job in jobs]
+
+
+CHECK_REPAIR_MODES = ("leaks", "all")
+CHECK_UNSUPPORTED = 63  # qemu-img check exit status for formats without consistency checks
+
+
+class CheckResult:
+    """Outcome of qemu-img check on one image
+    
+    leaks and corruptions are the cluster counts left after the check (and
+    repair, if any was asked for); leaks_fixed and corruptions_fixed are
+    what the repair fixed. cached is True when a clean check of the same
+    file version was reused instead of running qemu-img again.
+    """
+    
+    __slots__ = ("path", "status", "leaks", "corruptions", "check_errors", "leaks_fixed",
+                 "corruptions_fixed", "message", "seconds", "cached")
+    
+    # Counters reported by qemu-img check --output=json
+    FIELDS = ("leaks", "corruptions", "check_errors", "leaks_fixed", "corruptions_fixed")
+    
+    # Status values
+    CLEAN = "clean"
+    LEAKS = "leaks"
+    CORRUPT = "corrupt"
+    UNSUPPORTED = "unsupported"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    NOT_RUN = "not run"
+    
+    def __init__(self, path, status, leaks=0, corruptions=0, check_errors=0, leaks_fixed=0,
+                 corruptions_fixed=0, message="", seconds=0.0, cached=False):
+        self.path = path
+        self.status = status
+        self.leaks = leaks or 0
+        self.corruptions = corruptions or 0
+        self.check_errors = check_errors or 0
+        self.leaks_fixed = leaks_fixed or 0
+        self.corruptions_fixed = corruptions_fixed or 0
+        self.message = message
+        self.seconds = seconds or 0.0
+        self.cached = cached
+    
+    @property
+    def ok(self):
+        """True if nothing is wrong with the image (or its format has nothing to check)"""
+        return self.status in (self.CLEAN, self.UNSUPPORTED)
+    
+    def summary(self):
+        """Short description for tables, such as 3 leaks or corrupt (2)"""
+        if self.status == self.CORRUPT:
+            text = f"corrupt ({self.corruptions})"
+            if self.leaks:
+                text += f", {self.leaks} leaks"
+            return text
+        if self.status == self.LEAKS:
+            return f"{self.leaks} leaks"
+        if self.status == self.CLEAN and (self.leaks_fixed or self.corruptions_fixed):
+            return f"repaired ({self.leaks_fixed + self.corruptions_fixed})"
+        return self.status
+    
+    def to_dict(self):
+        data = {"status": self.status}
+        for name in self.FIELDS:
+            data[name] = getattr(self, name)
+        data["message"] = self.message
+        data["seconds"] = round(self.seconds, 3)
+        data["cached"] = self.cached
+        return data
+    
+    def __str__(self):
+        text = f"{self.summary():<16} {self.path}"
+        if self.cached:
+            text += " (unchanged since last clean check)"
+        elif self.seconds:
+            text += f" ({self.seconds:.1f}s)"
+        if self.leaks_fixed or self.corruptions_fixed:
+            text += f", fixed {self.leaks_fixed} leaks and {self.corruptions_fixed} corruptions"
+        if self.message:
+            text += f": {self.message}"
+        return text
+
+
+def check_disk(file_path, repair=None, stop=None):
+    """Run qemu-img check --output=json on an image and return its CheckResult
+    
+    repair is None, "leaks" or "all" (qemu-img check -r). stop is an
+    optional callable; when it returns True the check is killed.
+    """
+    if repair is not None and repair not in CHECK_REPAIR_MODES:
+        raise ValueError(f"repair must be one of {', '.join(CHECK_REPAIR_MODES)}")
+    cmd = ["qemu-img", "check", "--output=json"]
+    if repair:
+        cmd += ["-r", repair]
+    cmd.append(file_path)
+    
+    start = time.monotonic()
+    metrics.count("subprocess: qemu-img check")
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, errors="replace")
+    except OSError as e:
+        return CheckResult(file_path, CheckResult.FAILED, message=str(e))
+    
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if stop is not None and stop():
+                proc.kill()
+                proc.communicate()
+                return CheckResult(file_path, CheckResult.CANCELLED,
+                                   seconds=time.monotonic() - start)
+    seconds = time.monotonic() - start
+    metrics.record("qemu-img check", seconds)
+    
+    if proc.returncode == CHECK_UNSUPPORTED:
+        return CheckResult(file_path, CheckResult.UNSUPPORTED, seconds=seconds)
+    try:
+        # Exit status 2 (corruptions) and 3 (leaks) still print the report
+        report = json.loads(stdout)
+    except ValueError:
+        return CheckResult(file_path, CheckResult.FAILED, message=stderr.strip() or stdout.strip(),
+                           seconds=seconds)
+    
+    counts = {name: report.get(name.replace("_", "-"), 0) for name in CheckResult.FIELDS}
+    if counts["check_errors"] or proc.returncode == 1:
+        status = CheckResult.FAILED
+    elif counts["corruptions"]:
+        status = CheckResult.CORRUPT
+    elif counts["leaks"]:
+        status = CheckResult.LEAKS
+    else:
+        status = CheckResult.CLEAN
+    return CheckResult(file_path, status, message=stderr.strip() if status == CheckResult.FAILED else "",
+                       seconds=seconds, **counts)
+
+
+def check_all(paths, max_jobs=4, repair=None, cache=None, force=False, on_result=None,
+              stop=None):
+    """Check many images in parallel and return one CheckResult per path, in input order
+    
+    The largest images start first, so the run is not left waiting on one
+    big image at the end. With a ProbeCache, images unchanged since their
+    last clean check are skipped unless force is set. on_result is called with each result as
+    it finishes; stop() returning True kills running checks and marks the
+    rest as not run.
+    """
+    if repair is not None and repair not in CHECK_REPAIR_MODES:
+        raise ValueError(f"repair must be one of {', '.join(CHECK_REPAIR_MODES)}")
+    
+    def check(path):
+        if stop is not None and stop():
+            return CheckResult(path, CheckResult.NOT_RUN, message="cancelled")
+        if cache is not None:
+            return cache.check(path, repair=repair, stop=stop, force=force)
+        return check_disk(path, repair=repair, stop=stop)
+    
+    def size(path):
+        try:
+            return allocated_bytes(os.stat(path))
+        except OSError:
+            return 0
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(max_jobs)),
+                            thread_name_prefix="qemu-check") as executor:
+        futures = [executor.submit(check, path)
+                   for path in sorted(set(paths), key=size, reverse=True)]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.path] = result
+            if on_result is not None:
+                on_result(result)
+    return [results[path] for path in paths]
+
+
+SNAPSHOT_ACTIONS = {"create": "-c", "apply": "-a", "delete": "-d"}
+# One row of qemu-img snapshot -l; the tag may contain spaces, the ICOUNT column is newer,
+# and a disk-only snapshot's VM SIZE is a bare 0 with no unit
+SNAPSHOT_LINE = re.compile(r"^(?P<id>\S+)\s+(?P<name>.*?)\s+"
+                           r"(?P<vm_size>\d+(?:\.\d+)?(?:\s?[KMGTPE]?i?B)?)\s+"
+                           r"(?P<date>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\s+"
+                           r"(?P<vm_clock>\d+:\d\d:\d\d\.\d+)(?:\s+\S+)?\s*$")
+
+
+class Snapshot:
+    """One internal snapshot of an image, as listed by qemu-img snapshot -l"""
+    
+    __slots__ = ("id", "name", "vm_size", "date", "vm_clock")
+    
+    FIELDS = __slots__
+    
+    def __init__(self, id, name, vm_size="0 B", date="", vm_clock=""):
+        self.id = id
+        self.name = name
+        self.vm_size = vm_size  # Saved VM state, as qemu-img prints it
+        self.date = date
+        self.vm_clock = vm_clock
+    
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+    
+    def __str__(self):
+        return f"{self.id:>4}  {self.name:<24} {self.date}  {self.vm_size}"
+
+
+def parse_snapshot_list(output):
+    """Parse qemu-img snapshot -l output into a list of Snapshots
+    
+    >>> rows = parse_snapshot_list(
+    ...     "Snapshot list:\\n"
+    ...     "ID        TAG               VM SIZE                DATE     VM CLOCK     ICOUNT\\n"
+    ...     "1         base                    0 2024-05-01 10:00:00 00:00:00.000          0\\n"
+    ...     "2         before upgrade    1.5 MiB 2024-05-02 11:30:00 00:12:34.567\\n"
+    ...     "3         empty                 0 B 2024-05-03 09:00:00 00:00:00.000\\n")
+    >>> [(row.id, row.name, row.vm_size) for row in rows]
+    [('1', 'base', '0'), ('2', 'before upgrade', '1.5 MiB'), ('3', 'empty', '0 B')]
+    """
+    snapshots = []
+    for line in output.splitlines():
+        match = SNAPSHOT_LINE.match(line.strip())
+        if match:
+            snapshots.append(Snapshot(**match.groupdict()))
+    return snapshots
+
+
+def list_snapshots(file_path):
+    """Run qemu-img snapshot -l on an image and return its Snapshots"""
+    cmd = ["qemu-img", "snapshot", "-l", file_path]
+    metrics.count("subprocess: qemu-img snapshot")
+    with metrics.span("qemu-img snapshot -l"):
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return parse_snapshot_list(result.stdout)
+
+
+class SnapshotResult:
+    """Outcome of one snapshot operation on one image"""
+    
+    __slots__ = ("path", "action", "name", "status", "message", "seconds", "snapshots")
+    
+    # Status values
+    DONE = "done"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    NOT_RUN = "not run"
+    
+    def __init__(self, path, action, name, status, message="", seconds=0.0, snapshots=None):
+        self.path = path
+        self.action = action
+        self.name = name
+        self.status = status
+        self.message = message
+        self.seconds = seconds
+        self.snapshots = snapshots  # Snapshots of the image afterwards, when known
+    
+    def to_dict(self):
+        return {"path": self.path, "action": self.action, "name": self.name,
+                "status": self.status, "message": self.message,
+                "seconds": round(self.seconds, 3)}
+    
+    def __str__(self):
+        text = f"{self.status:<8} {self.action} {self.name!r} on {self.path}"
+        if self.status == self.DONE:
+            text += f" ({self.seconds:.2f}s)"
+        if self.message:
+            text += f": {self.message}"
+        return text
+
+
+def run_snapshot(file_path, action, name, cache=None):
+    """Create, apply or delete an internal snapshot and return a SnapshotResult
+    
+    The image's snapshot list (from cache, when given) is read first, so
+    creating a name that already exists or deleting or applying one that
+    doesn't is skipped instead of run.
+    """
+    if action not in SNAPSHOT_ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(SNAPSHOT_ACTIONS)}")
+    start = time.monotonic()
+    try:
+        before = cache.snapshots(file_path) if cache is not None else list_snapshots(file_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        message = (getattr(e, "stderr", None) or str(e)).strip()
+        return SnapshotResult(file_path, action, name, SnapshotResult.FAILED, message,
+                              time.monotonic() - start)
+    
+    exists = any(snapshot.name == name for snapshot in before)
+    if action == "create" and exists:
+        return SnapshotResult(file_path, action, name, SnapshotResult.SKIPPED, "already exists",
+                              time.monotonic() - start, before)
+    if action != "create" and not exists:
+        return SnapshotResult(file_path, action, name, SnapshotResult.SKIPPED, "no such snapshot",
+                              time.monotonic() - start, before)
+    
+    cmd = ["qemu-img", "snapshot", SNAPSHOT_ACTIONS[action], name, file_path]
+    metrics.count("subprocess: qemu-img snapshot")
+    try:
+        with metrics.span(f"qemu-img snapshot {SNAPSHOT_ACTIONS[action]}"):
+            subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        message = (getattr(e, "stderr", None) or str(e)).strip()
+        return SnapshotResult(file_path, action, name, SnapshotResult.FAILED, message,
+                              time.monotonic() - start)
+    seconds = time.monotonic() - start
+    
+    # The image changed, so this lists it again and caches the new list
+    try:
+        after = cache.snapshots(file_path) if cache is not None else list_snapshots(file_path)
+    except (OSError, subprocess.CalledProcessError):
+        after = None
+    return SnapshotResult(file_path, action, name, SnapshotResult.DONE, "", seconds, after)
+
+
+def snapshot_all(paths, action, name, max_jobs=4, cache=None, on_result=None, stop=None):
+    """Run the same snapshot action on many images in parallel
+    
+    Returns one SnapshotResult per path, in input order; on_result is
+    called with each result as it finishes. Once stop() returns True,
+    images that have not started are marked as not run; running
+    qemu-img processes are left to finish so no image is left half done.
+    """
+    if action not in SNAPSHOT_ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(SNAPSHOT_ACTIONS)}")
+    if not name:
+        raise ValueError("snapshot name must not be empty")
+    
+    def snapshot(path):
+        if stop is not None and stop():
+            return SnapshotResult(path, action, name, SnapshotResult.NOT_RUN, "cancelled")
+        return run_snapshot(path, action, name, cache)
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(max_jobs)),
+                            thread_name_prefix="qemu-snapshot") as executor:
+        futures = [executor.submit(snapshot, path) for path in dict.fromkeys(paths)]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.path] = result
+            if on_result is not None:
+                on_result(result)
+    return [results[path] for path in paths]
+
+
+CSV_FIELDS = ['Filename', 'Size', 'Format', 'Path', 'Scan_Date', 'Virtual_Size_Bytes',
+              'Actual_Size_Bytes', 'Cluster_Size', 'Dirty', 'Backing_File', 'Data_Bytes',
+              'Zero_Bytes', 'Backing_Bytes', 'Unallocated_Bytes', 'Check_Status',
+              'Leaked_Clusters', 'Corrupt_Clusters', 'Snapshots']
+# Columns exported as text; every other column is an integer (or null)
+EXPORT_TEXT_FIELDS = ('Filename', 'Size', 'Format', 'Path', 'Scan_Date', 'Backing_File',
+                      'Check_Status')
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_CHUNK_ROWS = 5000
+
+
+def iter_export_rows(disks, scan_date=None):
+    """Yield one export row (a dict keyed by CSV_FIELDS) per disk record"""
+    if scan_date is None:
+        scan_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    for disk in disks:
+        allocation = disk.allocation
+        check = disk.check
+        yield {
+            'Filename': disk.filename,
+            'Size': disk.size,
+            'Format': disk.format,
+            'Path': disk.full_path,  # Empty string if path not available
+            'Scan_Date': scan_date,
+            'Virtual_Size_Bytes': disk.virtual_size,
+            'Actual_Size_Bytes': disk.actual_size,
+            'Cluster_Size': disk.cluster_size,
+            'Dirty': int(disk.dirty),
+            'Backing_File': disk.backing_file,
+            'Data_Bytes': allocation.data if allocation is not None else None,
+            'Zero_Bytes': allocation.zero if allocation is not None else None,
+            'Backing_Bytes': allocation.backing if allocation is not None else None,
+            'Unallocated_Bytes': allocation.unallocated if allocation is not None else None,
+            'Check_Status': check.status if check is not None else None,
+            'Leaked_Clusters': check.leaks if check is not None else None,
+            'Corrupt_Clusters': check.corruptions if check is not None else None,
+            'Snapshots': len(disk.snapshots) if disk.snapshots is not None else None,
+        }
+
+
+def write_csv(disks, csvfile, scan_date=None):
+    """Write disk records to an open text file as CSV and return the row count"""
+    writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    
+    count = 0
+    for row in iter_export_rows(disks, scan_date):
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def export_format(file_path):
+    """Guess (format, gzip) from an export file name, e.g. disks.jsonl.gz"""
+    name = file_path.lower()
+    compressed = name.endswith(".gz")
+    if compressed:
+        name = name[:-3]
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl", compressed
+    if name.endswith(".parquet"):
+        return "parquet", compressed
+    return "csv", compressed
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_disks(disks, file_path, format=None, compress=None, chunk_rows=EXPORT_CHUNK_ROWS,
+                 on_progress=None, stop=None):
+    """Stream disk records to a CSV, JSON Lines or Parquet file and return the row count
+    
+    Rows are generated lazily and written chunk_rows at a time, so memory
+    does not grow with the inventory. format and compress (gzip) default
+    to what the file name says. Parquet needs pyarrow and writes one row
+    group per chunk, compressed with gzip instead of snappy when asked.
+    The file is written under a temporary name and only appears when
+    complete; stop() returning True abandons it. on_progress(rows) is
+    called after every chunk.
+    """
+    guessed_format, guessed_compress = export_format(file_path)
+    format = format or guessed_format
+    compress = guessed_compress if compress is None else compress
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    
+    temp_path = file_path + ".part"
+    count = 0
+    chunks = _chunks(iter_export_rows(disks), chunk_rows)
+    try:
+        if format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+            # Fixed schema: type inference would turn a column that is all None in the
+            # first chunk into null type and reject later chunks
+            schema = pyarrow.schema(
+                [(field, pyarrow.string() if field in EXPORT_TEXT_FIELDS else pyarrow.int64())
+                 for field in CSV_FIELDS])
+            # Opened up front so an empty inventory still writes a valid (empty) file
+            writer = pyarrow.parquet.ParquetWriter(
+                temp_path, schema, compression="gzip" if compress else "snappy")
+            try:
+                for chunk in chunks:
+                    if stop is not None and stop():
+                        return None
+                    table = pyarrow.Table.from_pydict(
+                        {field: [row[field] for row in chunk] for field in CSV_FIELDS},
+                        schema=schema)
+                    writer.write_table(table)
+                    count += len(chunk)
+                    if on_progress is not None:
+                        on_progress(count)
+            finally:
+                writer.close()
+        else:
+            if compress:
+                stream = gzip.open(temp_path, "wt", compresslevel=6, newline="", encoding="utf-8")
+            else:
+                stream = open(temp_path, "w", newline="", encoding="utf-8")
+            with stream:
+                if format == "csv":
+                    csv.DictWriter(stream, fieldnames=CSV_FIELDS).writeheader()
+                for chunk in chunks:
+                    if stop is not None and stop():
+                        return None
+                    # One buffered write per chunk instead of one per row
+                    buffer = io.StringIO()
+                    if format == "csv":
+                        csv.DictWriter(buffer, fieldnames=CSV_FIELDS).writerows(chunk)
+                    else:
+                        for row in chunk:
+                            buffer.write(json.dumps(row))
+                            buffer.write("\n")
+                    stream.write(buffer.getvalue())
+                    count += len(chunk)
+                    if on_progress is not None:
+                        on_progress(count)
+        os.replace(temp_path, file_path)
+        return count
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
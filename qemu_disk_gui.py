@@ -0,0 +1,1984 @@
+"""Tk GUI for the QEMU disk manager"""
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+import subprocess
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from qemu_disk_core import (CHECK_REPAIR_MODES, CONVERT_CACHE_MODES, CONVERT_FORMATS,
+                            DEFAULT_PROBE_WORKERS, CheckResult, ConvertJob, ConvertResult,
+                            CreateResult, DiskProber, DiskRegistry, DiskWatcher, ProbeCache,
+                            ScanProgress, ScanRoot, SnapshotResult, batch_create, check_all,
+                            convert_all, convert_sources, create_disk_image, default_cache_path,
+                            export_disks, format_size, is_valid_size, load_manifest,
+                            load_scan_roots, metrics, save_scan_roots, scan_disks, scan_roots,
+                            snapshot_all)
+
+
+def open_file(file_path):
+    """Open a file with the desktop's default application"""
+    if sys.platform == "win32":
+        os.startfile(file_path)
+    elif sys.platform == "darwin":
+        subprocess.Popen(["open", file_path])
+    else:
+        subprocess.Popen(["xdg-open", file_path])
+
+
+class BackgroundTask:
+    """Run a blocking job on a worker thread and feed its output back to Tk
+    
+    The job is called as job(task) on a daemon thread. It passes results to
+    the GUI with task.emit() and progress with task.report(). Both go through
+    a queue that is drained on the Tk event loop with after(), in batches, so
+    the worker never touches a widget and the window stays responsive.
+    """
+    
+    POLL_MS = 50
+    BATCH_SIZE = 500
+    
+    def __init__(self, root, job, on_batch=None, on_progress=None,
+                 on_done=None, on_error=None):
+        self.root = root
+        self.job = job
+        self.on_batch = on_batch
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+    
+    def start(self):
+        """Start the worker thread and begin polling for its output"""
+        self._thread.start()
+        self.root.after(self.POLL_MS, self._poll)
+        return self
+    
+    def cancel(self):
+        """Ask the job to stop; it checks task.cancelled between units of work"""
+        self._cancel.set()
+    
+    def join(self, timeout=None):
+        """Wait for the worker thread; returns False if it is still running after timeout"""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+    
+    def emit(self, item):
+        """Queue one result for the GUI (worker thread)"""
+        self._queue.put(("item", item))
+    
+    def report(self, progress):
+        """Queue a progress update for the GUI (worker thread)"""
+        self._queue.put(("progress", progress))
+    
+    def _run(self):
+        try:
+            result = metrics.profiled(self.job, self)
+        except Exception as e:
+            self._queue.put(("error", e))
+        else:
+            self._queue.put(("done", result))
+    
+    def _poll(self):
+        items = []
+        progress = None
+        finished = None
+        
+        try:
+            while len(items) < self.BATCH_SIZE:
+                kind, payload = self._queue.get_nowait()
+                if kind == "item":
+                    items.append(payload)
+                elif kind == "progress":
+                    progress = payload
+                else:
+                    finished = (kind, payload)
+                    break
+        except queue.Empty:
+            pass
+        
+        if items and self.on_batch:
+            self.on_batch(items)
+        if progress is not None and self.on_progress:
+            self.on_progress(progress)
+        
+        if finished is None:
+            # Come back right away if the batch was cut short by BATCH_SIZE
+            delay = 1 if len(items) >= self.BATCH_SIZE else self.POLL_MS
+            self.root.after(delay, self._poll)
+        elif finished[0] == "done":
+            if self.on_done:
+                self.on_done(finished[1])
+        elif self.on_error:
+            self.on_error(finished[1])
+
+
+class VirtualDiskTable:
+    """Treeview front end that only materializes the rows currently in view
+    
+    The model is the list of records in display order, read from the
+    source registry's DiskIndex with the current search text and sort
+    column, plus an optional filter predicate. A small pool of Tk items,
+    one per visible row, is refilled from the visible slice of the model
+    whenever it scrolls or changes, and only items whose values changed are
+    touched, so inserts, searching, scrolling and memory use do not grow
+    with the number of disks.
+    """
+    
+    def __init__(self, tree, scrollbar, source, values):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.source = source
+        self.values = values
+        self._rows = []  # Records in display order
+        self.offset = 0  # Model index of the top visible row
+        self.visible_count = int(tree.cget("height"))
+        self.items = []  # Pooled item ids, top to bottom
+        self.item_records = {}  # Item id -> record it currently shows
+        self.item_values = {}  # Item id -> (values, tags) it currently shows
+        self.selected = None
+        self.filter = None
+        self.search_text = ""
+        self.sort_column = None
+        self.sort_reverse = False
+        self._stale = False  # Rows must be read from the index again
+        self._refresh_pending = False
+        self._measured = False
+        
+        scrollbar.configure(command=self.yview)
+        tree.configure(selectmode="browse")
+        tree.bind("<<TreeviewSelect>>", self._on_select)
+        tree.bind("<Configure>", lambda event: self._resize())
+        tree.bind("<MouseWheel>", self._on_mousewheel)
+        tree.bind("<Button-4>", lambda event: self._scroll_units(-3))
+        tree.bind("<Button-5>", lambda event: self._scroll_units(3))
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "page-up"),
+                          ("<Next>", "page-down"), ("<Home>", "home"), ("<End>", "end")):
+            tree.bind(key, lambda event, step=step: self._move_selection(step))
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    # Model
+    
+    @property
+    def rows(self):
+        """Records in display order"""
+        if self._stale:
+            self._update_rows()
+        return self._rows
+    
+    def rebuild(self):
+        """Read the rows from the index again on the next redraw (after changes to records)"""
+        self._stale = True
+        self.refresh()
+    
+    def set_filter(self, predicate):
+        """Show only records for which predicate(record) is true (None shows all)"""
+        self.filter = predicate
+        self.offset = 0
+        self.rebuild()
+    
+    def search(self, text):
+        """Show only records whose path contains text (^text: filename starts with text)"""
+        text = text.strip()
+        if text != self.search_text:
+            self.search_text = text
+            self.offset = 0
+            self.rebuild()
+    
+    def sort_by(self, column, reverse=False):
+        """Order rows by one of DiskIndex.COLUMNS (None keeps insertion order)"""
+        self.sort_column = column
+        self.sort_reverse = reverse
+        self.rebuild()
+    
+    def extend(self, records):
+        """Add newly registered records to the view"""
+        if self.sort_column is not None or self.search_text:
+            # The index knows where they go
+            self.rebuild()
+            return
+        if self.filter is not None:
+            records = [record for record in records if self.filter(record)]
+        if records:
+            self._rows.extend(records)
+            self.refresh()
+    
+    def remove(self, record):
+        """Drop a record from the view"""
+        try:
+            self._rows.remove(record)
+        except ValueError:
+            pass
+        if self.selected is record:
+            self.selected = None
+        self.refresh()
+    
+    def select(self, record):
+        """Select a record and scroll it into view"""
+        self.selected = record
+        try:
+            index = self.rows.index(record)
+        except ValueError:
+            self.selected = None
+        else:
+            self.see(index)
+        self.refresh()
+    
+    # View
+    
+    def see(self, index):
+        """Scroll so the row at a model index is visible"""
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.visible_count:
+            self.offset = index - self.visible_count + 1
+    
+    def refresh(self):
+        """Redraw the visible rows once the event loop is idle"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.tree.after_idle(self._redraw)
+    
+    def _update_rows(self):
+        self._stale = False
+        with metrics.span("table query", search=self.search_text, sort=self.sort_column or ""):
+            rows = self.source.index.select(self.search_text, self.sort_column, self.sort_reverse)
+            if self.filter is not None:
+                rows = [record for record in rows if self.filter(record)]
+        self._rows = rows
+        if self.selected is not None and self.selected not in rows:
+            self.selected = None
+    
+    def _redraw(self):
+        with metrics.span("table redraw"):
+            self._draw()
+    
+    def _draw(self):
+        self._refresh_pending = False
+        rows = self.rows
+        total = len(rows)
+        self.offset = max(0, min(self.offset, total - self.visible_count))
+        shown = rows[self.offset:self.offset + self.visible_count]
+        
+        # Grow or shrink the item pool to the number of rows on screen
+        while len(self.items) < len(shown):
+            self.items.append(self.tree.insert("", tk.END))
+        while len(self.items) > len(shown):
+            item_id = self.items.pop()
+            self.item_values.pop(item_id, None)
+            self.tree.delete(item_id)
+        
+        self.item_records = {}
+        selected_item = None
+        for position, (item_id, record) in enumerate(zip(self.items, shown)):
+            # Stripes follow the model index so they don't shift while scrolling
+            tag = 'oddrow' if (self.offset + position) % 2 == 0 else 'evenrow'
+            shown_values = (self.values(record), tag)
+            if self.item_values.get(item_id) != shown_values:
+                # Only rows that actually changed go through Tk
+                self.tree.item(item_id, values=shown_values[0], tags=(tag,))
+                self.item_values[item_id] = shown_values
+            self.item_records[item_id] = record
+            if record is self.selected:
+                selected_item = item_id
+        
+        if selected_item is not None:
+            if self.tree.selection() != (selected_item,):
+                self.tree.selection_set(selected_item)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        
+        if total:
+            self.scrollbar.set(self.offset / total, (self.offset + len(shown)) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        
+        # The first drawn row tells us the real row height; size the pool to it
+        if shown and not self._measured:
+            self._measured = True
+            self.tree.after_idle(self._resize)
+    
+    def _resize(self):
+        # Derive the row geometry from a drawn row when there is one
+        height = self.tree.winfo_height()
+        row_height, header_height = 20, 25
+        if self.items:
+            bbox = self.tree.bbox(self.items[0])
+            if bbox:
+                header_height, row_height = bbox[1], bbox[3]
+        count = max(1, (height - header_height) // max(row_height, 1))
+        if count != self.visible_count:
+            self.visible_count = count
+            self.refresh()
+    
+    def yview(self, *args):
+        """Scrollbar command: handles moveto and scroll requests"""
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(1, self.visible_count - 1)
+            self.offset += amount
+        self.refresh()
+    
+    def _scroll_units(self, amount):
+        self.offset += amount
+        self.refresh()
+        return "break"
+    
+    def _on_mousewheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        steps = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_units(-3 * steps if steps else 0)
+    
+    def _move_selection(self, step):
+        if not self.rows:
+            return "break"
+        try:
+            index = self.rows.index(self.selected) if self.selected is not None else -1
+        except ValueError:
+            index = -1
+        page = max(1, self.visible_count - 1)
+        if step == "home":
+            index = 0
+        elif step == "end":
+            index = len(self.rows) - 1
+        elif step == "page-up":
+            index -= page
+        elif step == "page-down":
+            index += page
+        else:
+            index += step
+        index = max(0, min(index, len(self.rows) - 1))
+        self.selected = self.rows[index]
+        self.see(index)
+        self.refresh()
+        return "break"
+    
+    def _on_select(self, event):
+        # Ignore the selection being cleared when the selected row scrolls away
+        selection = self.tree.selection()
+        if selection:
+            record = self.item_records.get(selection[0])
+            if record is not None:
+                self.selected = record
+
+
+class QEMUDiskCreator:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("QEMU Virtual Disk Manager")
+        self.root.geometry("900x800")  # Wider for the table
+        
+        # Configure grid weights for responsiveness
+        self.root.grid_columnconfigure(0, weight=1)
+        self.root.grid_rowconfigure(3, weight=1)
+        
+        # Variables
+        self.disk_path = tk.StringVar()
+        self.disk_format = tk.StringVar(value="qcow2")
+        self.disk_size = tk.StringVar(value="20G")
+        self.probe_workers = tk.IntVar(value=DEFAULT_PROBE_WORKERS)
+        self.batch_dry_run = tk.BooleanVar(value=False)
+        self.watch_enabled = tk.BooleanVar(value=False)
+        self.disks = DiskRegistry()  # Disks in the list, by path and by table item
+        self.active_tasks = set()  # Background tasks that are still running
+        self.scan_task = None
+        self.watcher = None  # DiskWatcher while "Watch for changes" is on
+        self.watch_task = None
+        self.metrics_log = None  # Path of the JSON-lines timing log while it is open
+        self.roots_tree = None  # Treeview of the Scan Roots window while it is open
+        
+        # Saved scan roots; a broken config file just starts an empty list
+        try:
+            self.scan_roots = load_scan_roots()
+        except (OSError, ValueError):
+            self.scan_roots = []
+        
+        # Persistent qemu-img info cache; fall back to memory if it can't be opened
+        try:
+            self.probe_cache = ProbeCache()
+        except (OSError, sqlite3.Error):
+            self.probe_cache = ProbeCache(":memory:")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Title
+        title_label = ttk.Label(root, text="QEMU Virtual Disk Manager", 
+                               font=("Arial", 16, "bold"))
+        title_label.grid(row=0, column=0, padx=20, pady=(20, 10), sticky="w")
+        
+        # Folder Selection Section
+        folder_frame = ttk.LabelFrame(root, text="1. Select Disk Location", padding=10)
+        folder_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
+        folder_frame.grid_columnconfigure(0, weight=1)
+        
+        # Path entry and browse button
+        path_frame = ttk.Frame(folder_frame)
+        path_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        path_frame.grid_columnconfigure(0, weight=1)
+        
+        ttk.Entry(path_frame, textvariable=self.disk_path, 
+                 font=("Courier", 10)).grid(row=0, column=0, sticky="ew", padx=(0, 10))
+        ttk.Button(path_frame, text="Browse Folder", 
+                  command=self.browse_folder).grid(row=0, column=1)
+        
+        # Scan Folder button
+        button_frame = ttk.Frame(folder_frame)
+        button_frame.grid(row=1, column=0, sticky="w")
+        ttk.Button(button_frame, text="Scan Folder for Virtual Disks", 
+                  command=self.scan_folder, style="Secondary.TButton").pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Scan Roots...",
+                  command=self.manage_scan_roots).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(button_frame, text="(Scans for .qcow2 and .raw files)").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(button_frame, text="Parallel probes:").pack(side=tk.LEFT, padx=(20, 5))
+        ttk.Spinbox(button_frame, from_=1, to=256, width=5,
+                   textvariable=self.probe_workers).pack(side=tk.LEFT)
+        ttk.Checkbutton(button_frame, text="Watch for changes", variable=self.watch_enabled,
+                       command=self.toggle_watch).pack(side=tk.LEFT, padx=(20, 0))
+        
+        # Disk Creation Section
+        create_frame = ttk.LabelFrame(root, text="2. Create Virtual Disk", padding=10)
+        create_frame.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
+        
+        # Format selection (qcow2 vs raw)
+        ttk.Label(create_frame, text="Disk Format:").grid(row=0, column=0, padx=(0, 5), pady=5, sticky="w")
+        
+        format_frame = ttk.Frame(create_frame)
+        format_frame.grid(row=0, column=1, sticky="w", pady=5)
+        
+        ttk.Radiobutton(format_frame, text="QCOW2 (Recommended)", 
+                       variable=self.disk_format, value="qcow2").pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Radiobutton(format_frame, text="RAW", 
+                       variable=self.disk_format, value="raw").pack(side=tk.LEFT)
+        
+        # Size selection
+        ttk.Label(create_frame, text="Disk Size:").grid(row=1, column=0, padx=(0, 5), pady=5, sticky="w")
+        
+        size_frame = ttk.Frame(create_frame)
+        size_frame.grid(row=1, column=1, sticky="w", pady=5)
+        
+        size_entry = ttk.Entry(size_frame, textvariable=self.disk_size, width=10)
+        size_entry.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(size_frame, text="(e.g., 20G, 50G, 100G)").pack(side=tk.LEFT)
+        
+        # Create button
+        ttk.Button(create_frame, text="Create Virtual Disk", 
+                  command=self.create_disk, style="Accent.TButton").grid(row=2, column=0, columnspan=2, pady=(15, 5))
+        
+        # Batch creation from a manifest file
+        batch_frame = ttk.Frame(create_frame)
+        batch_frame.grid(row=3, column=0, columnspan=2, pady=(5, 0))
+        ttk.Button(batch_frame, text="Batch Create from Manifest...", 
+                  command=self.batch_create_disks, style="Secondary.TButton").pack(side=tk.LEFT)
+        ttk.Checkbutton(batch_frame, text="Dry run", 
+                       variable=self.batch_dry_run).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(batch_frame, text="(CSV, JSON or YAML)").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(batch_frame, text="Convert Disks...", 
+                  command=self.convert_disks, style="Secondary.TButton").pack(side=tk.LEFT, padx=(20, 0))
+        
+        # Disk Management Section
+        manage_frame = ttk.LabelFrame(root, text="3. Created Virtual Disks", padding=10)
+        manage_frame.grid(row=3, column=0, padx=20, pady=(10, 20), sticky="nsew")
+        manage_frame.grid_columnconfigure(0, weight=1)
+        manage_frame.grid_rowconfigure(1, weight=1)
+        
+        # Search box; the table is filtered as you type
+        search_frame = ttk.Frame(manage_frame)
+        search_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        search_frame.grid_columnconfigure(1, weight=1)
+        self.search_var = tk.StringVar()
+        ttk.Label(search_frame, text="Search:").grid(row=0, column=0, padx=(0, 5))
+        ttk.Entry(search_frame, textvariable=self.search_var).grid(row=0, column=1, sticky="ew")
+        ttk.Button(search_frame, text="Clear",
+                  command=lambda: self.search_var.set("")).grid(row=0, column=2, padx=(5, 0))
+        ttk.Label(search_frame, text="(path contains text; ^text: filename starts with text)").grid(
+            row=0, column=3, padx=(10, 0))
+        self.search_var.trace_add("write", lambda *args: self.search_table())
+        
+        # Treeview for table display
+        tree_frame = ttk.Frame(manage_frame)
+        tree_frame.grid(row=1, column=0, sticky="nsew", pady=(0, 10))
+        tree_frame.grid_columnconfigure(0, weight=1)
+        tree_frame.grid_rowconfigure(0, weight=1)
+        
+        # Create vertical scrollbar
+        v_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL)
+        v_scrollbar.grid(row=0, column=1, sticky="ns")
+        
+        # Create horizontal scrollbar
+        h_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL)
+        h_scrollbar.grid(row=1, column=0, sticky="ew", columnspan=2)
+        
+        # Create Treeview with columns
+        columns = ("filename", "size", "allocated", "data", "data_percent", "format", "check",
+                   "snapshots", "path")
+        self.disk_tree = ttk.Treeview(tree_frame, columns=columns, 
+                                     show="headings", height=8,
+                                     yscrollcommand=v_scrollbar.set,
+                                     xscrollcommand=h_scrollbar.set)
+        
+        # Configure scrollbars
+        h_scrollbar.config(command=self.disk_tree.xview)
+        
+        # Define column headings and widths
+        column_config = [
+            ("filename", "Filename", 150),
+            ("size", "Size", 100),
+            ("allocated", "Allocated", 100),
+            ("data", "Data", 90),
+            ("data_percent", "Data %", 70),
+            ("format", "Format", 80),
+            ("check", "Check", 100),
+            ("snapshots", "Snapshots", 80),
+            ("path", "Path", 330)
+        ]
+        
+        # Clicking a heading sorts by that column
+        self.column_titles = {}
+        for col_id, col_text, col_width in column_config:
+            self.column_titles[col_id] = col_text
+            self.disk_tree.heading(col_id, text=col_text,
+                                   command=lambda col_id=col_id: self.sort_table(col_id))
+            self.disk_tree.column(col_id, width=col_width, minwidth=50)
+        
+        self.disk_tree.grid(row=0, column=0, sticky="nsew")
+        
+        # Add a tag for alternate row colors
+        self.disk_tree.tag_configure('oddrow', background='#f0f0f0')
+        self.disk_tree.tag_configure('evenrow', background='white')
+        
+        # Only the visible rows are real Tk items; the vertical scrollbar drives the model
+        self.disk_table = VirtualDiskTable(self.disk_tree, v_scrollbar, self.disks,
+                                           lambda disk: (disk.filename, disk.size, disk.disk_size,
+                                                         disk.data_size, disk.data_percent,
+                                                         disk.format, disk.check_status,
+                                                         disk.snapshot_count, disk.full_path))
+        
+        # Bind double-click event to show full path
+        self.disk_tree.bind("<Double-1>", self.on_double_click)
+        
+        # Capacity totals, kept up to date by the registry
+        self.totals_var = tk.StringVar()
+        ttk.Label(manage_frame, textvariable=self.totals_var).grid(row=2, column=0, sticky="w")
+        self.update_totals()
+        
+        # Buttons for disk management
+        button_frame = ttk.Frame(manage_frame)
+        button_frame.grid(row=3, column=0, sticky="ew", pady=(5, 0))
+        
+        ttk.Button(button_frame, text="Show Full Path", 
+                  command=self.show_full_path).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Copy Path to Clipboard", 
+                  command=self.copy_to_clipboard).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Get Disk Info", 
+                  command=self.get_disk_info).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Backing Chains", 
+                  command=self.show_backing_chains).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Analyze Allocation", 
+                  command=self.analyze_allocation).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Check Integrity...", 
+                  command=self.check_disks).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Snapshots...", 
+                  command=self.manage_snapshots).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Export List", 
+                  command=self.export_list, style="Secondary.TButton").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Remove from List", 
+                  command=self.remove_from_list, style="Danger.TButton").pack(side=tk.LEFT)
+        
+        # Status bar with progress and cancel for background tasks
+        status_frame = ttk.Frame(root)
+        status_frame.grid(row=4, column=0, sticky="ew", padx=20, pady=(0, 5))
+        status_frame.grid_columnconfigure(0, weight=1)
+        
+        self.status_var = tk.StringVar(value="Ready to create virtual disks")
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, 
+                              relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.grid(row=0, column=0, sticky="ew")
+        
+        self.progress_bar = ttk.Progressbar(status_frame, mode="determinate", length=150)
+        self.progress_bar.grid(row=0, column=1, padx=(10, 0))
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", 
+                                       command=self.cancel_tasks, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=2, padx=(10, 0))
+        ttk.Button(status_frame, text="Diagnostics", 
+                  command=self.show_diagnostics).grid(row=0, column=3, padx=(10, 0))
+        
+        # Configure styles
+        style = ttk.Style()
+        style.configure("Accent.TButton", font=("Arial", 10, "bold"))
+        style.configure("Secondary.TButton", font=("Arial", 10))
+        style.configure("Danger.TButton", font=("Arial", 10, "bold"), foreground="red")
+        style.configure("Treeview", font=("Courier", 9))
+        style.configure("Treeview.Heading", font=("Arial", 9, "bold"))
+
+    def browse_folder(self):
+        """Open folder browser dialog"""
+        folder_selected = filedialog.askdirectory(title="Select Folder for Virtual Disk")
+        if folder_selected:
+            self.disk_path.set(folder_selected)
+            self.status_var.set(f"Selected folder: {folder_selected}")
+
+    def scan_folder(self):
+        """Scan selected folder for QEMU virtual disk files in the background"""
+        folder = self.disk_path.get()
+        
+        if not folder or not os.path.exists(folder):
+            messagebox.showerror("Error", "Please select a valid folder first!")
+            return
+        
+        if self.scan_task is not None:
+            messagebox.showwarning("Warning", "A scan is already running!")
+            return
+        
+        try:
+            max_workers = self.probe_workers.get()
+        except tk.TclError:
+            max_workers = DEFAULT_PROBE_WORKERS
+        
+        cache = self.probe_cache
+        
+        def job(task):
+            progress = ScanProgress()
+            cache.reset_stats()
+            
+            # Find all .qcow2 and .raw files in the folder and subdirectories, probe
+            # them in parallel and hand each one over as soon as it finishes
+            last_report = 0.0
+            for record in scan_disks(folder, probe=cache.probe, max_workers=max_workers,
+                                     progress=progress, stop=lambda: task.cancelled):
+                task.emit(record)
+                progress.cache_hits = cache.hits
+                progress.cache_misses = cache.misses
+                
+                now = time.monotonic()
+                if now - last_report >= 0.1:
+                    task.report(progress.snapshot())
+                    last_report = now
+            
+            cache.flush()
+            return progress
+        
+        self.scan_stats = {"added": 0, "duplicates": 0}
+        self.status_var.set(f"Scanning folder: {folder}...")
+        self.progress_bar.configure(value=0, maximum=1)
+        self.scan_task = self.run_task(job,
+                                       on_batch=self.on_scan_batch,
+                                       on_progress=self.on_scan_progress,
+                                       on_done=lambda progress: self.on_scan_done(folder, progress),
+                                       on_error=self.on_scan_error)
+
+    def on_scan_batch(self, disks):
+        """Add a batch of probed disks to the list, skipping duplicates"""
+        with metrics.span("scan batch insert", rows=len(disks)):
+            self.add_scanned_disks(disks)
+
+    def add_scanned_disks(self, disks):
+        """Register scanned records and show the new ones in the table"""
+        added = []
+        for record in disks:
+            existing = self.disks.get(record.full_path)
+            
+            if existing is None:
+                self.disks.add(record)
+                added.append(record)
+            elif existing.same_disk(record):
+                # Duplicate: same path, filename, size and format
+                self.scan_stats["duplicates"] += 1
+        
+        self.add_disks_to_tree(added)
+        self.scan_stats["added"] += len(added)
+
+    def on_scan_progress(self, progress):
+        """Show scan progress in the status bar"""
+        self.status_var.set(str(progress))
+        self.progress_bar.configure(maximum=max(progress.found, 1), value=progress.probed)
+
+    def on_scan_done(self, folder, progress):
+        """Report the result of a finished or cancelled scan"""
+        cancelled = self.scan_task.cancelled
+        self.scan_task = None
+        metrics.record("scan folder", time.monotonic() - progress.started,
+                       found=progress.found, failed=progress.failed, cancelled=cancelled)
+        self.on_scan_progress(progress)
+        added_count = self.scan_stats["added"]
+        duplicate_count = self.scan_stats["duplicates"]
+        
+        if cancelled:
+            self.status_var.set(f"Scan cancelled: Added {added_count} disks, "
+                                f"{progress.probed} of {progress.found} files probed")
+            return
+        
+        if not progress.found:
+            messagebox.showinfo("Scan Results", f"No virtual disk files (.qcow2 or .raw) found in:\n{folder}")
+            self.status_var.set("No virtual disks found")
+            return
+        
+        # Update status
+        self.status_var.set(f"Scan complete: Added {added_count} disks, skipped {duplicate_count} duplicates "
+                            f"({progress.rate():.1f} files/s, cache: {progress.cache_hits} hits, "
+                            f"{progress.cache_misses} misses)")
+        
+        if added_count > 0:
+            messagebox.showinfo("Scan Complete", 
+                              f"Found {progress.found} virtual disk file(s).\n"
+                              f"Added {added_count} to the list.\n"
+                              f"Skipped {duplicate_count} duplicate(s).")
+        else:
+            messagebox.showinfo("Scan Complete", 
+                              f"No new virtual disks found.\n"
+                              f"All {progress.found} file(s) were already in the list or were duplicates.")
+
+    def on_scan_error(self, error):
+        """Report a scan that failed outside of the per-file probes"""
+        self.scan_task = None
+        messagebox.showerror("Scan Error", f"Error scanning folder:\n{str(error)}")
+        self.status_var.set("Scan failed")
+
+    def manage_scan_roots(self):
+        """Edit the saved scan roots and scan all of them at once"""
+        if self.roots_tree is not None:
+            self.roots_tree.winfo_toplevel().lift()
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Scan Roots")
+        dialog.transient(self.root)
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.grid_columnconfigure(0, weight=1)
+        frame.grid_rowconfigure(0, weight=1)
+        
+        tree = ttk.Treeview(frame, columns=("path", "workers", "status"), show="headings",
+                            height=8, selectmode="browse")
+        tree.heading("path", text="Folder")
+        tree.heading("workers", text="Probes")
+        tree.heading("status", text="Status")
+        tree.column("path", width=360)
+        tree.column("workers", width=60, anchor="e")
+        tree.column("status", width=260)
+        tree.grid(row=0, column=0, columnspan=6, sticky="nsew")
+        workers = tk.IntVar(value=DEFAULT_PROBE_WORKERS)
+        
+        def fill():
+            tree.delete(*tree.get_children())
+            for root in self.scan_roots:
+                tree.insert("", tk.END, iid=root.path, values=(root.path, root.workers, ""))
+        
+        def save():
+            try:
+                save_scan_roots(self.scan_roots)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save the scan roots:\n{str(e)}", parent=dialog)
+            fill()
+        
+        def add():
+            folder = filedialog.askdirectory(title="Add Scan Root", parent=dialog)
+            if not folder:
+                return
+            folder = os.path.abspath(folder)
+            try:
+                count = workers.get()
+            except tk.TclError:
+                count = DEFAULT_PROBE_WORKERS
+            self.scan_roots = [root for root in self.scan_roots if root.path != folder]
+            self.scan_roots.append(ScanRoot(folder, count))
+            save()
+        
+        def remove():
+            selection = tree.selection()
+            if selection:
+                self.scan_roots = [root for root in self.scan_roots if root.path != selection[0]]
+                save()
+        
+        def apply_workers():
+            selection = tree.selection()
+            if not selection:
+                return
+            try:
+                count = max(1, workers.get())
+            except tk.TclError:
+                return
+            for root in self.scan_roots:
+                if root.path == selection[0]:
+                    root.workers = count
+            save()
+            tree.selection_set(selection[0])
+        
+        def on_select(event):
+            selection = tree.selection()
+            for root in self.scan_roots:
+                if selection and root.path == selection[0]:
+                    workers.set(root.workers)
+        
+        def on_close():
+            self.roots_tree = None
+            dialog.destroy()
+        
+        tree.bind("<<TreeviewSelect>>", on_select)
+        dialog.protocol("WM_DELETE_WINDOW", on_close)
+        ttk.Button(frame, text="Add Folder...", command=add).grid(row=1, column=0, sticky="w", pady=(10, 0))
+        ttk.Button(frame, text="Remove", command=remove).grid(row=1, column=1, pady=(10, 0), padx=5)
+        ttk.Label(frame, text="Probes:").grid(row=1, column=2, pady=(10, 0))
+        ttk.Spinbox(frame, from_=1, to=256, width=5, textvariable=workers).grid(row=1, column=3, pady=(10, 0))
+        ttk.Button(frame, text="Apply", command=apply_workers).grid(row=1, column=4, pady=(10, 0), padx=5)
+        ttk.Button(frame, text="Scan All Roots", style="Accent.TButton",
+                   command=self.scan_all_roots).grid(row=1, column=5, pady=(10, 0))
+        self.roots_tree = tree
+        fill()
+
+    def scan_all_roots(self):
+        """Scan every saved root at once, one shard per root, into the same list"""
+        roots = [root for root in self.scan_roots if root.enabled]
+        if not roots:
+            messagebox.showwarning("Warning", "Add at least one scan root first!")
+            return
+        
+        if self.scan_task is not None:
+            messagebox.showwarning("Warning", "A scan is already running!")
+            return
+        
+        cache = self.probe_cache
+        
+        def job(task):
+            progress = {}
+            cache.reset_stats()
+            
+            last_report = 0.0
+            for root, record in scan_roots(roots, probe=cache.probe, progress=progress,
+                                           stop=lambda: task.cancelled):
+                task.emit(record)
+                
+                now = time.monotonic()
+                if now - last_report >= 0.1:
+                    task.report({path: shard.snapshot() for path, shard in progress.items()})
+                    last_report = now
+            
+            cache.flush()
+            return progress
+        
+        self.scan_stats = {"added": 0, "duplicates": 0}
+        self.status_var.set(f"Scanning {len(roots)} roots...")
+        self.progress_bar.configure(value=0, maximum=1)
+        self.scan_task = self.run_task(job,
+                                       on_batch=self.on_scan_batch,
+                                       on_progress=self.on_roots_progress,
+                                       on_done=self.on_roots_done,
+                                       on_error=self.on_scan_error)
+
+    def on_roots_progress(self, progress):
+        """Show combined progress in the status bar and per-root progress in the roots window"""
+        found = sum(shard.found for shard in progress.values())
+        probed = sum(shard.probed for shard in progress.values())
+        running = sum(1 for shard in progress.values() if shard.finished is None)
+        self.status_var.set(f"Scanning {len(progress)} roots ({running} running): "
+                            f"{found} found, {probed} probed")
+        self.progress_bar.configure(maximum=max(found, 1), value=probed)
+        
+        if self.roots_tree is None:
+            return
+        for path, shard in progress.items():
+            if not self.roots_tree.exists(path):
+                continue
+            if shard.error:
+                status = f"Error: {shard.error}"
+            else:
+                status = (f"{shard.found} found, {shard.probed} probed, "
+                          f"{shard.elapsed():.1f}s ({shard.rate():.1f}/s)")
+                if shard.finished is None:
+                    status = "Scanning: " + status
+            self.roots_tree.set(path, "status", status)
+
+    def on_roots_done(self, progress):
+        """Report the result of a multi-root scan with a line per root"""
+        cancelled = self.scan_task.cancelled
+        self.scan_task = None
+        self.on_roots_progress(progress)
+        found = sum(shard.found for shard in progress.values())
+        metrics.record("scan roots", max((shard.elapsed() for shard in progress.values()), default=0.0),
+                       roots=len(progress), found=found, cancelled=cancelled)
+        added_count = self.scan_stats["added"]
+        duplicate_count = self.scan_stats["duplicates"]
+        
+        if cancelled:
+            self.status_var.set(f"Scan cancelled: Added {added_count} disks from {len(progress)} roots")
+            return
+        
+        self.status_var.set(f"Scan complete: Added {added_count} disks from {len(progress)} roots, "
+                            f"skipped {duplicate_count} duplicates")
+        lines = []
+        for path, shard in progress.items():
+            if shard.error:
+                lines.append(f"{path}\n    error: {shard.error}")
+            else:
+                lines.append(f"{path}\n    {shard.found} found, {shard.probed - shard.failed} probed, "
+                             f"{shard.failed} failed in {shard.elapsed():.1f}s ({shard.rate():.1f} files/s)")
+        messagebox.showinfo("Scan Complete",
+                            f"Found {found} virtual disk file(s) in {len(progress)} roots.\n"
+                            f"Added {added_count} to the list, skipped {duplicate_count} duplicate(s).\n\n"
+                            + "\n".join(lines))
+
+    def toggle_watch(self):
+        """Start or stop keeping the list in sync with the selected folder"""
+        if not self.watch_enabled.get():
+            self.stop_watch()
+            self.status_var.set("Stopped watching for changes")
+            return
+        
+        folder = self.disk_path.get()
+        if not folder or not os.path.isdir(folder):
+            self.watch_enabled.set(False)
+            messagebox.showerror("Error", "Please select a valid folder first!")
+            return
+        
+        try:
+            max_workers = self.probe_workers.get()
+        except tk.TclError:
+            max_workers = DEFAULT_PROBE_WORKERS
+        
+        cache = self.probe_cache
+        prober = DiskProber(max_workers, probe=cache.probe)
+        watcher = DiskWatcher(folder)
+        
+        def job(task):
+            # Probe settled files here so the GUI only has to apply the results
+            def on_changes(changed, removed):
+                for path in removed:
+                    task.emit(("removed", path))
+                for path, record, error in prober.probe_all(changed):
+                    if error is None:
+                        task.emit(("changed", record))
+                cache.flush()
+            
+            watcher.run(on_changes)
+        
+        def on_stopped(error=None):
+            if self.watcher is watcher:
+                self.watcher = None
+                self.watch_task = None
+                self.watch_enabled.set(False)
+            if error is not None:
+                messagebox.showerror("Watch Error", f"Stopped watching {folder}:\n{str(error)}")
+        
+        # Kept out of active_tasks so Cancel does not stop the watch
+        self.watcher = watcher
+        self.watch_task = BackgroundTask(self.root, job, on_batch=self.on_watch_batch,
+                                         on_done=lambda result: on_stopped(),
+                                         on_error=on_stopped).start()
+        self.status_var.set(f"Watching for changes: {folder}")
+
+    def stop_watch(self):
+        """Stop the folder watch, if one is running"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watch_task.cancel()
+            self.watcher = None
+            self.watch_task = None
+
+    def on_watch_batch(self, events):
+        """Apply watched additions, changes and removals to the list"""
+        added = []
+        rebuild = False
+        for kind, payload in events:
+            if kind == "removed":
+                record = self.disks.get(payload)
+                if record is not None and self.disks.remove(record):
+                    rebuild = True
+            else:
+                existing = self.disks.get(payload.full_path)
+                if existing is None:
+                    self.disks.add(payload)
+                    added.append(payload)
+                elif not existing.same_disk(payload) or existing.actual_size != payload.actual_size:
+                    self.disks.update(existing, payload)
+                    rebuild = True
+        
+        if rebuild:
+            # One model rebuild covers every removal and in-place change in the batch
+            self.disk_table.rebuild()
+            self.update_totals()
+        if added:
+            self.add_disks_to_tree(added)
+        
+        changed_count = sum(1 for kind, _ in events if kind == "changed")
+        removed_count = len(events) - changed_count
+        self.status_var.set(f"Watch: {changed_count} added or changed, {removed_count} removed "
+                            f"({time.strftime('%H:%M:%S')})")
+
+    def on_close(self):
+        """Stop background work, save the probe cache and close the window"""
+        tasks = list(self.active_tasks)
+        if self.watch_task is not None:
+            tasks.append(self.watch_task)
+        self.stop_watch()
+        for task in tasks:
+            task.cancel()
+        # Workers write to the probe cache, so it is only closed once they have all stopped;
+        # one still stuck in qemu-img after the timeout ends with the process instead
+        deadline = time.monotonic() + 10
+        stopped = all([task.join(max(0.0, deadline - time.monotonic())) for task in tasks])
+        metrics.close_log()
+        if stopped:
+            try:
+                self.probe_cache.close()
+            except sqlite3.Error:
+                pass
+        self.root.destroy()
+
+    def run_task(self, job, on_batch=None, on_progress=None, on_done=None, on_error=None):
+        """Start a background task and keep the Cancel button in sync with it"""
+        def finish(callback):
+            def handler(value):
+                self.active_tasks.discard(task)
+                if not self.active_tasks:
+                    self.cancel_button.configure(state=tk.DISABLED)
+                if callback:
+                    callback(value)
+            return handler
+        
+        task = BackgroundTask(self.root, job, on_batch=on_batch, on_progress=on_progress,
+                              on_done=finish(on_done), on_error=finish(on_error))
+        self.active_tasks.add(task)
+        self.cancel_button.configure(state=tk.NORMAL)
+        return task.start()
+
+    def cancel_tasks(self):
+        """Cancel all running background tasks"""
+        for task in self.active_tasks:
+            task.cancel()
+        self.status_var.set("Cancelling...")
+
+    def add_disks_to_tree(self, records):
+        """Show newly registered disk records in the table"""
+        # Striping and drawing happen on the model, one redraw per batch
+        self.disk_table.extend(records)
+        self.update_totals()
+
+    def update_totals(self):
+        """Show the disk count and capacity totals under the table"""
+        totals = (f"{len(self.disks)} disk(s), "
+                  f"{format_size(self.disks.total_virtual)} virtual, "
+                  f"{format_size(self.disks.total_actual)} allocated")
+        if self.disk_table.search_text:
+            totals += f" ({len(self.disk_table)} matching the search)"
+        self.totals_var.set(totals)
+
+    def search_table(self):
+        """Filter the table to the search box text"""
+        self.disk_table.search(self.search_var.get())
+        self.update_totals()
+
+    def sort_table(self, column):
+        """Sort by a column; clicking again reverses, a third click restores list order"""
+        table = self.disk_table
+        if table.sort_column != column:
+            table.sort_by(column)
+        elif not table.sort_reverse:
+            table.sort_by(column, reverse=True)
+        else:
+            table.sort_by(None)
+        
+        for col_id, title in self.column_titles.items():
+            if col_id == table.sort_column:
+                title += " \u25bc" if table.sort_reverse else " \u25b2"
+            self.disk_tree.heading(col_id, text=title)
+
+    def create_disk(self):
+        """Create virtual disk using qemu-img command"""
+        # Validate inputs
+        folder = self.disk_path.get()
+        disk_format = self.disk_format.get()
+        size = self.disk_size.get().strip().upper()
+        
+        if not folder:
+            messagebox.showerror("Error", "Please select a folder first!")
+            return
+        
+        # Validate size format (e.g., 20G, 100M)
+        if not is_valid_size(size):
+            messagebox.showerror("Error", "Invalid size format! Use format like: 20G, 100M, 1T")
+            return
+        
+        # Ask for disk filename
+        disk_name = filedialog.asksaveasfilename(
+            initialdir=folder,
+            title="Save Virtual Disk As",
+            defaultextension=f".{disk_format}",
+            filetypes=[(f"{disk_format.upper()} files", f"*.{disk_format}"), ("All files", "*.*")]
+        )
+        
+        if not disk_name:
+            return  # User cancelled
+        
+        def on_done(record):
+            # Add to list, or refresh the row if an existing disk was overwritten
+            if self.disks.add(record):
+                self.add_disks_to_tree([record])
+            else:
+                self.disks.update(self.disks.get(record.full_path), record)
+                self.disk_table.rebuild()
+                self.update_totals()
+            
+            self.status_var.set(f"Successfully created: {os.path.basename(disk_name)}")
+            messagebox.showinfo("Success", f"Virtual disk created successfully!\n\n"
+                                          f"Path: {disk_name}\n"
+                                          f"Format: {disk_format}\n"
+                                          f"Size: {size}")
+        
+        def on_error(error):
+            if isinstance(error, subprocess.CalledProcessError):
+                messagebox.showerror("Error", f"Failed to create disk:\n{error.stderr}")
+                self.status_var.set("Disk creation failed")
+            elif isinstance(error, FileNotFoundError):
+                messagebox.showerror("Error", "qemu-img not found! Make sure QEMU is installed and in your PATH.")
+                self.status_var.set("QEMU not found")
+            else:
+                messagebox.showerror("Error", f"Failed to create disk:\n{str(error)}")
+                self.status_var.set("Disk creation failed")
+        
+        # Execute command in the background
+        self.status_var.set(f"Creating {size} {disk_format} disk...")
+        self.run_task(lambda task: create_disk_image(disk_name, disk_format, size),
+                      on_done=on_done, on_error=on_error)
+
+    def on_double_click(self, event):
+        """Handle double-click on treeview item"""
+        self.show_full_path()
+
+    def get_selected_disk(self):
+        """Get the currently selected disk info"""
+        return self.disk_table.selected
+
+    def show_full_path(self):
+        """Show full path of selected disk"""
+        disk_info = self.get_selected_disk()
+        if not disk_info:
+            messagebox.showwarning("Warning", "Please select a disk from the list first!")
+            return
+        
+        path = disk_info.full_path
+        if not path:
+            messagebox.showinfo("Disk Path", "No path information available for this disk.")
+            self.status_var.set("No path information available")
+            return
+        
+        messagebox.showinfo("Disk Path", f"Full path:\n{path}")
+        self.status_var.set(f"Showing path for: {disk_info.filename}")
+
+    def copy_to_clipboard(self):
+        """Copy selected disk path to clipboard"""
+        disk_info = self.get_selected_disk()
+        if not disk_info:
+            messagebox.showwarning("Warning", "Please select a disk from the list first!")
+            return
+        
+        path = disk_info.full_path
+        if not path:
+            messagebox.showwarning("Warning", "No path available to copy!")
+            return
+        
+        self.root.clipboard_clear()
+        self.root.clipboard_append(path)
+        self.status_var.set(f"Copied to clipboard: {disk_info.filename}")
+        messagebox.showinfo("Copied", "Path copied to clipboard!")
+
+    def get_disk_info(self):
+        """Get detailed information about selected disk using qemu-img info"""
+        disk_info = self.get_selected_disk()
+        if not disk_info:
+            messagebox.showwarning("Warning", "Please select a disk from the list first!")
+            return
+        
+        path = disk_info.full_path
+        if not path:
+            messagebox.showwarning("Warning", "No path information available for this disk!")
+            return
+        
+        def on_error(error):
+            if isinstance(error, subprocess.CalledProcessError):
+                messagebox.showerror("Error", f"Failed to get disk info:\n{error.stderr}")
+            elif isinstance(error, FileNotFoundError) and error.filename == path:
+                messagebox.showerror("Error", f"Disk file not found:\n{path}")
+            elif isinstance(error, FileNotFoundError):
+                messagebox.showerror("Error", "qemu-img not found!")
+            else:
+                messagebox.showerror("Error", f"Failed to get disk info:\n{str(error)}")
+            self.status_var.set("Failed to get disk info")
+        
+        # Run qemu-img info command in the background unless the cache is current
+        self.status_var.set(f"Getting info for: {disk_info.filename}...")
+        def job(task):
+            with metrics.span("disk info lookup"):
+                return self.probe_cache.info_json(path)
+        
+        self.run_task(job,
+                      on_done=lambda details: self.show_disk_info(disk_info, details),
+                      on_error=on_error)
+
+    def show_disk_info(self, disk_info, details):
+        """Show qemu-img info output for a disk in a scrollable window"""
+        path = disk_info.full_path
+        
+        # Show info in message box
+        info_text = f"Disk: {disk_info.filename}\n"
+        info_text += f"Path: {path}\n"
+        info_text += f"Format: {disk_info.format}\n"
+        info_text += f"Virtual Size: {disk_info.size}\n"
+        info_text += f"Allocated: {disk_info.disk_size or 'Unknown'}\n"
+        if disk_info.cluster_size:
+            info_text += f"Cluster Size: {disk_info.cluster_size}\n"
+        if disk_info.dirty:
+            info_text += "Dirty: yes (image was not closed cleanly)\n"
+        if disk_info.backing_chain:
+            info_text += "Backing Chain:\n"
+            info_text += "".join(f"  -> {backing}\n" for backing in disk_info.backing_chain)
+        if disk_info.allocation is not None:
+            info_text += f"Allocation Map: {disk_info.allocation}\n"
+        if disk_info.check is not None:
+            info_text += f"Integrity Check: {disk_info.check.summary()}"
+            if disk_info.check.message:
+                info_text += f" ({disk_info.check.message})"
+            info_text += "\n"
+        if disk_info.snapshots:
+            info_text += "Snapshots:\n"
+            info_text += "".join(f"  {snapshot}\n" for snapshot in disk_info.snapshots)
+        dependents = self.disks.graph.dependents(path)
+        if dependents:
+            direct = len(self.disks.graph.children(path))
+            info_text += f"Overlays: {direct} direct, {len(dependents)} in total\n"
+        info_text += "\nDetailed Information:\n"
+        info_text += "-" * 40 + "\n"
+        try:
+            info_text += json.dumps(json.loads(details), indent=2)
+        except ValueError:
+            info_text += details
+        
+        self.show_text_window(f"Disk Information: {disk_info.filename}", info_text)
+        
+        self.status_var.set(f"Retrieved info for: {disk_info.filename}")
+
+    def show_backing_chains(self):
+        """Summarize the backing-file graph of the listed disks"""
+        graph = self.disks.graph
+        if not len(graph):
+            messagebox.showinfo("Backing Chains", "No disks in the list. Scan a folder first.")
+            return
+        
+        # Everything comes from the probed records, no qemu-img calls needed
+        summary = graph.summary()
+        text = f"Images: {summary['images']}\n"
+        text += f"Overlays: {summary['overlays']}\n"
+        text += f"Base images: {summary['bases']}\n"
+        text += f"Orphaned overlays: {summary['orphans']}\n"
+        text += f"Deepest chain: {summary['max_depth']}"
+        if summary["deepest"]:
+            text += f" ({summary['deepest']})"
+        text += "\n"
+        
+        text += "\nBase Images (by number of dependent overlays):\n"
+        text += "-" * 40 + "\n"
+        bases = sorted(((len(graph.dependents(base)), base) for base in graph.bases()),
+                       reverse=True)
+        for count, base in bases:
+            text += f"{count:>6}  {base}\n"
+        
+        orphans = graph.orphans()
+        if orphans:
+            text += "\nOrphaned Overlays (backing file missing):\n"
+            text += "-" * 40 + "\n"
+            for record in orphans:
+                text += f"{record.full_path}\n  -> {record.backing_chain[0]}\n"
+        
+        self.show_text_window("Backing Chains", text)
+        self.status_var.set(f"{summary['bases']} base image(s), {summary['overlays']} overlay(s), "
+                            f"{summary['orphans']} orphaned")
+
+    def analyze_allocation(self):
+        """Map the allocation of every listed disk with qemu-img map in the background"""
+        records = list(self.disk_table.rows)
+        if not records:
+            messagebox.showwarning("Warning", "No disks in the list to analyze!")
+            return
+        
+        try:
+            max_workers = self.probe_workers.get()
+        except tk.TclError:
+            max_workers = DEFAULT_PROBE_WORKERS
+        
+        cache = self.probe_cache
+        
+        def job(task):
+            # Unchanged images come straight from the cache; the rest are mapped in parallel
+            def analyze(path, st):
+                return cache.allocation(path, stop=lambda: task.cancelled)
+            
+            prober = DiskProber(max_workers, probe=analyze)
+            failed = 0
+            for path, summary, error in prober.probe_all((r.full_path, None) for r in records):
+                if task.cancelled:
+                    break
+                if error is not None:
+                    failed += 1
+                elif summary is not None:
+                    task.emit((path, summary))
+            return failed
+        
+        analyzed = []
+        
+        def on_batch(items):
+            for path, summary in items:
+                record = self.disks.get(path)
+                if record is not None:
+                    record.allocation = summary
+                    self.disks.changed(record)
+                    analyzed.append(summary)
+            self.disk_table.rebuild()
+            self.progress_bar.configure(maximum=len(records), value=len(analyzed))
+            self.status_var.set(f"Analyzing allocation: {len(analyzed)} of {len(records)} disk(s)")
+        
+        def on_done(failed):
+            data = sum(summary.data for summary in analyzed)
+            zero = sum(summary.zero for summary in analyzed)
+            unallocated = sum(summary.unallocated for summary in analyzed)
+            status = (f"Analyzed {len(analyzed)} disk(s): {format_size(data)} data, "
+                      f"{format_size(zero)} zero, {format_size(unallocated)} unallocated")
+            if failed:
+                status += f", {failed} failed"
+            self.status_var.set(status)
+        
+        def on_error(error):
+            messagebox.showerror("Error", f"Allocation analysis failed:\n{str(error)}")
+            self.status_var.set("Allocation analysis failed")
+        
+        self.status_var.set(f"Analyzing allocation of {len(records)} disk(s)...")
+        self.progress_bar.configure(value=0, maximum=len(records))
+        self.run_task(job, on_batch=on_batch, on_done=on_done, on_error=on_error)
+
+    def check_disks(self):
+        """Ask for qemu-img check options and check the selected or all listed disks"""
+        if not self.disks:
+            messagebox.showwarning("Warning", "No disks in the list to check!")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Check Integrity")
+        dialog.transient(self.root)
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        selected = self.get_selected_disk()
+        scope = tk.StringVar(value="selected" if selected else "all")
+        repair = tk.StringVar(value="")
+        max_jobs = tk.IntVar(value=4)
+        force = tk.BooleanVar(value=False)
+        
+        ttk.Radiobutton(frame, text=f"Selected disk ({selected.filename})" if selected else "Selected disk",
+                        variable=scope, value="selected",
+                        state=tk.NORMAL if selected else tk.DISABLED).grid(row=0, column=0, columnspan=2, sticky="w")
+        ttk.Radiobutton(frame, text=f"All {len(self.disk_table)} disks in the list", variable=scope,
+                        value="all").grid(row=1, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        
+        ttk.Label(frame, text="Repair (-r):").grid(row=2, column=0, sticky="w", pady=2)
+        ttk.Combobox(frame, textvariable=repair, values=("",) + CHECK_REPAIR_MODES, width=10,
+                     state="readonly").grid(row=2, column=1, sticky="w")
+        ttk.Label(frame, text="Checks at once:").grid(row=3, column=0, sticky="w", pady=2)
+        ttk.Spinbox(frame, from_=1, to=64, width=5, textvariable=max_jobs).grid(row=3, column=1, sticky="w")
+        ttk.Checkbutton(frame, text="Check again even if unchanged since the last clean check",
+                        variable=force).grid(row=4, column=0, columnspan=2, sticky="w", pady=2)
+        
+        def start():
+            records = [selected] if scope.get() == "selected" else list(self.disk_table.rows)
+            try:
+                jobs = max_jobs.get()
+            except tk.TclError:
+                messagebox.showerror("Error", "Checks at once must be a number", parent=dialog)
+                return
+            if repair.get() and not messagebox.askyesno(
+                    "Repair Images",
+                    "Repairing writes to the images. Make sure no running VM is using them.\n\n"
+                    "Continue?", parent=dialog):
+                return
+            dialog.destroy()
+            self.run_checks(records, jobs, repair.get() or None, force.get())
+        
+        ttk.Button(frame, text="Check", command=start,
+                   style="Accent.TButton").grid(row=5, column=0, columnspan=2, pady=(15, 0))
+
+    def run_checks(self, records, max_jobs, repair, force):
+        """Run qemu-img check on records in the background and show the results in the list"""
+        cache = self.probe_cache
+        paths = [record.full_path for record in records]
+        
+        def job(task):
+            return check_all(paths, max_jobs=max_jobs, repair=repair, cache=cache, force=force,
+                             on_result=task.emit, stop=lambda: task.cancelled)
+        
+        checked = []
+        
+        def on_batch(results):
+            for result in results:
+                record = self.disks.get(result.path)
+                if record is not None:
+                    record.check = result
+                    self.disks.changed(record)
+                checked.append(result)
+            self.disk_table.rebuild()
+            self.progress_bar.configure(maximum=len(paths), value=len(checked))
+            self.status_var.set(f"Checking integrity: {len(checked)} of {len(paths)} disk(s)")
+        
+        def on_done(results):
+            bad = [result for result in results if not result.ok and result.status != CheckResult.NOT_RUN]
+            skipped = sum(1 for result in results if result.cached)
+            repaired = [result for result in results if result.leaks_fixed or result.corruptions_fixed]
+            self.status_var.set(f"Checked {len(results)} disk(s): {len(bad)} with problems, "
+                                f"{len(repaired)} repaired, {skipped} unchanged since their last clean check")
+            if bad or repaired:
+                self.show_text_window("Integrity Check Results",
+                                      "\n".join(str(result) for result in bad + repaired))
+        
+        def on_error(error):
+            messagebox.showerror("Error", f"Integrity check failed:\n{str(error)}")
+            self.status_var.set("Integrity check failed")
+        
+        self.status_var.set(f"Checking integrity of {len(paths)} disk(s)...")
+        self.progress_bar.configure(value=0, maximum=len(paths))
+        self.run_task(job, on_batch=on_batch, on_done=on_done, on_error=on_error)
+
+    def manage_snapshots(self):
+        """List, create, revert to or delete an internal snapshot on the selected or listed qcow2 disks"""
+        records = [record for record in self.disk_table.rows if record.format == "qcow2"]
+        if not records:
+            messagebox.showwarning("Warning", "No qcow2 disks in the list!")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Snapshots")
+        dialog.transient(self.root)
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        selected = self.get_selected_disk()
+        if selected is not None and selected.format != "qcow2":
+            selected = None
+        scope = tk.StringVar(value="selected" if selected else "all")
+        action = tk.StringVar(value="list")
+        name = tk.StringVar(value=datetime.now().strftime("snap-%Y%m%d-%H%M%S"))
+        max_jobs = tk.IntVar(value=4)
+        
+        ttk.Radiobutton(frame, text=f"Selected disk ({selected.filename})" if selected else "Selected disk",
+                        variable=scope, value="selected",
+                        state=tk.NORMAL if selected else tk.DISABLED).grid(row=0, column=0, columnspan=2, sticky="w")
+        ttk.Radiobutton(frame, text=f"All {len(records)} qcow2 disks shown in the list", variable=scope,
+                        value="all").grid(row=1, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        
+        for row, (value, text) in enumerate((("list", "List snapshots (-l)"),
+                                             ("create", "Create snapshot (-c)"),
+                                             ("apply", "Revert to snapshot (-a)"),
+                                             ("delete", "Delete snapshot (-d)")), start=2):
+            ttk.Radiobutton(frame, text=text, variable=action, value=value).grid(
+                row=row, column=0, columnspan=2, sticky="w")
+        ttk.Label(frame, text="Snapshot name:").grid(row=6, column=0, sticky="w", pady=(10, 2))
+        ttk.Entry(frame, textvariable=name, width=28).grid(row=6, column=1, sticky="w", pady=(10, 2))
+        ttk.Label(frame, text="Images at once:").grid(row=7, column=0, sticky="w", pady=2)
+        ttk.Spinbox(frame, from_=1, to=64, width=5, textvariable=max_jobs).grid(row=7, column=1, sticky="w")
+        
+        def start():
+            targets = [selected] if scope.get() == "selected" else records
+            try:
+                jobs = max_jobs.get()
+            except tk.TclError:
+                messagebox.showerror("Error", "Images at once must be a number", parent=dialog)
+                return
+            snapshot_name = name.get().strip()
+            if action.get() != "list" and not snapshot_name:
+                messagebox.showerror("Error", "Please enter a snapshot name!", parent=dialog)
+                return
+            if action.get() in ("apply", "delete") and not messagebox.askyesno(
+                    "Snapshots",
+                    f"{'Revert' if action.get() == 'apply' else 'Delete snapshot'} "
+                    f"'{snapshot_name}' on {len(targets)} disk(s)? "
+                    f"Make sure no running VM is using them.", parent=dialog):
+                return
+            dialog.destroy()
+            if action.get() == "list":
+                self.list_snapshots(targets, jobs)
+            else:
+                self.run_snapshots(targets, action.get(), snapshot_name, jobs)
+        
+        ttk.Button(frame, text="Run", command=start,
+                   style="Accent.TButton").grid(row=8, column=0, columnspan=2, pady=(15, 0))
+
+    def list_snapshots(self, records, max_workers):
+        """List the snapshots of records in parallel, from the cache when unchanged"""
+        cache = self.probe_cache
+        
+        def job(task):
+            prober = DiskProber(max_workers, probe=lambda path, st: cache.snapshots(path))
+            failed = 0
+            for path, snapshots, error in prober.probe_all((r.full_path, None) for r in records):
+                if task.cancelled:
+                    break
+                if error is not None:
+                    failed += 1
+                else:
+                    task.emit((path, snapshots))
+            return failed
+        
+        listed = []
+        
+        def on_batch(items):
+            for path, snapshots in items:
+                record = self.disks.get(path)
+                if record is not None:
+                    record.snapshots = tuple(snapshots)
+                    self.disks.changed(record)
+                    listed.append(record)
+            self.disk_table.rebuild()
+            self.progress_bar.configure(maximum=len(records), value=len(listed))
+            self.status_var.set(f"Listing snapshots: {len(listed)} of {len(records)} disk(s)")
+        
+        def on_done(failed):
+            with_snapshots = [record for record in listed if record.snapshots]
+            status = (f"Listed {len(listed)} disk(s): {sum(len(r.snapshots) for r in listed)} "
+                      f"snapshot(s) on {len(with_snapshots)} disk(s)")
+            if failed:
+                status += f", {failed} failed"
+            self.status_var.set(status)
+            if with_snapshots:
+                self.show_text_window("Snapshots", "\n\n".join(
+                    record.full_path + "\n" + "\n".join(f"  {snapshot}" for snapshot in record.snapshots)
+                    for record in with_snapshots))
+        
+        def on_error(error):
+            messagebox.showerror("Error", f"Listing snapshots failed:\n{str(error)}")
+            self.status_var.set("Listing snapshots failed")
+        
+        self.status_var.set(f"Listing snapshots of {len(records)} disk(s)...")
+        self.progress_bar.configure(value=0, maximum=len(records))
+        self.run_task(job, on_batch=on_batch, on_done=on_done, on_error=on_error)
+
+    def run_snapshots(self, records, action, name, max_jobs):
+        """Create, revert to or delete a snapshot on records in parallel, one result per disk"""
+        cache = self.probe_cache
+        paths = [record.full_path for record in records]
+        
+        def job(task):
+            return snapshot_all(paths, action, name, max_jobs=max_jobs, cache=cache,
+                                on_result=task.emit, stop=lambda: task.cancelled)
+        
+        finished = []
+        
+        def on_batch(results):
+            for result in results:
+                record = self.disks.get(result.path)
+                if record is not None and result.snapshots is not None:
+                    record.snapshots = tuple(result.snapshots)
+                    self.disks.changed(record)
+                finished.append(result)
+            self.disk_table.rebuild()
+            self.progress_bar.configure(maximum=len(paths), value=len(finished))
+            self.status_var.set(f"Snapshot {action}: {len(finished)} of {len(paths)} disk(s)")
+        
+        def on_done(results):
+            counts = {}
+            for result in results:
+                counts[result.status] = counts.get(result.status, 0) + 1
+            self.status_var.set(f"Snapshot {action} '{name}': "
+                                + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+            if len(results) > 1 or any(r.status != SnapshotResult.DONE for r in results):
+                self.show_text_window(f"Snapshot {action}: {name}",
+                                      "\n".join(str(result) for result in results))
+        
+        def on_error(error):
+            messagebox.showerror("Error", f"Snapshot {action} failed:\n{str(error)}")
+            self.status_var.set(f"Snapshot {action} failed")
+        
+        self.status_var.set(f"Snapshot {action} '{name}' on {len(paths)} disk(s)...")
+        self.progress_bar.configure(value=0, maximum=len(paths))
+        self.run_task(job, on_batch=on_batch, on_done=on_done, on_error=on_error)
+
+    def show_diagnostics(self):
+        """Show per-stage latency and counters, with profiling and log toggles"""
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("760x460")
+        
+        controls = ttk.Frame(window, padding=(10, 10, 10, 0))
+        controls.pack(fill=tk.X)
+        text_widget = tk.Text(window, wrap=tk.NONE, font=("Courier", 9))
+        text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        log_path = os.path.join(os.path.dirname(default_cache_path()), "metrics.jsonl")
+        profile_enabled = tk.BooleanVar(value=metrics.profiling)
+        log_enabled = tk.BooleanVar(value=self.metrics_log is not None)
+        
+        def refresh():
+            text_widget.config(state=tk.NORMAL)
+            text_widget.delete("1.0", tk.END)
+            text_widget.insert(tk.END, metrics.report())
+            text_widget.config(state=tk.DISABLED)
+        
+        def reset():
+            metrics.reset()
+            refresh()
+        
+        def toggle_profile():
+            if profile_enabled.get():
+                metrics.start_profiling()
+                self.status_var.set("Profiling background tasks...")
+                return
+            output_path = filedialog.asksaveasfilename(
+                parent=window, title="Save Profile", defaultextension=".prof",
+                filetypes=[("cProfile data", "*.prof"), ("All files", "*.*")],
+                initialfile=f"qemu_disks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+            stats = metrics.stop_profiling(output_path or None)
+            if stats is None:
+                self.status_var.set("Profiling stopped, nothing was captured")
+            elif output_path:
+                self.status_var.set(f"Profile saved: {os.path.basename(output_path)}")
+            else:
+                self.status_var.set("Profiling stopped, profile discarded")
+        
+        def toggle_log():
+            try:
+                if log_enabled.get():
+                    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                    metrics.open_log(log_path)
+                    self.metrics_log = log_path
+                    self.status_var.set(f"Writing timing log: {log_path}")
+                else:
+                    metrics.close_log()
+                    self.metrics_log = None
+                    self.status_var.set("Timing log closed")
+            except OSError as e:
+                log_enabled.set(False)
+                messagebox.showerror("Error", f"Could not open the log file:\n{str(e)}", parent=window)
+        
+        ttk.Button(controls, text="Refresh", command=refresh).pack(side=tk.LEFT)
+        ttk.Button(controls, text="Reset", command=reset).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Checkbutton(controls, text="Profile background tasks (cProfile)", variable=profile_enabled,
+                       command=toggle_profile).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Checkbutton(controls, text="Write JSON-lines log", variable=log_enabled,
+                       command=toggle_log).pack(side=tk.LEFT, padx=(20, 0))
+        refresh()
+
+    def show_text_window(self, title, text):
+        """Show read-only text in a scrollable window"""
+        # Create a scrolled text window for better viewing
+        info_window = tk.Toplevel(self.root)
+        info_window.title(title)
+        info_window.geometry("600x400")
+        
+        text_frame = ttk.Frame(info_window)
+        text_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        scrollbar = ttk.Scrollbar(text_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        text_widget = tk.Text(text_frame, wrap=tk.WORD, yscrollcommand=scrollbar.set,
+                             font=("Courier", 9))
+        text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=text_widget.yview)
+        
+        text_widget.insert(tk.END, text)
+        text_widget.config(state=tk.DISABLED)
+        return info_window
+
+    def batch_create_disks(self):
+        """Create every disk listed in a manifest file in the background"""
+        manifest = filedialog.askopenfilename(
+            title="Select Disk Manifest",
+            initialdir=self.disk_path.get() or None,
+            filetypes=[("Manifests", "*.csv *.json *.yaml *.yml"), ("All files", "*.*")]
+        )
+        if not manifest:
+            return  # User cancelled
+        
+        try:
+            jobs = load_manifest(manifest)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Manifest Error", f"Invalid manifest:\n{str(e)}")
+            return
+        
+        if not jobs:
+            messagebox.showwarning("Warning", "The manifest doesn't list any disks!")
+            return
+        
+        try:
+            max_workers = self.probe_workers.get()
+        except tk.TclError:
+            max_workers = DEFAULT_PROBE_WORKERS
+        dry_run = self.batch_dry_run.get()
+        
+        def job(task):
+            return batch_create(jobs, max_workers=max_workers, dry_run=dry_run,
+                                on_result=task.emit, stop=lambda: task.cancelled)
+        
+        finished = []
+        
+        def on_batch(results):
+            finished.extend(results)
+            self.status_var.set(f"Batch create: {len(finished)} of {len(jobs)} job(s) finished")
+            self.progress_bar.configure(maximum=len(jobs), value=len(finished))
+        
+        def on_done(results):
+            # Add the disks that were actually created
+            created = [r.job.record() for r in results if r.status == CreateResult.CREATED]
+            self.add_disks_to_tree([record for record in created if self.disks.add(record)])
+            
+            failed = sum(1 for r in results if r.status == CreateResult.FAILED)
+            summary = (f"{len(results)} job(s): {len(created)} created, {failed} failed"
+                       + (" (dry run)" if dry_run else ""))
+            self.status_var.set(f"Batch create: {summary}")
+            self.show_text_window(f"Batch Create: {os.path.basename(manifest)}",
+                                  summary + "\n\n" + "\n".join(str(r) for r in results))
+        
+        def on_error(error):
+            messagebox.showerror("Error", f"Batch create failed:\n{str(error)}")
+            self.status_var.set("Batch create failed")
+        
+        self.status_var.set(f"Batch create: {len(jobs)} job(s) from {os.path.basename(manifest)}...")
+        self.progress_bar.configure(value=0, maximum=len(jobs))
+        self.run_task(job, on_batch=on_batch, on_done=on_done, on_error=on_error)
+
+    def convert_disks(self):
+        """Ask for qemu-img convert options and convert the selected or all listed disks"""
+        if not self.disks:
+            messagebox.showwarning("Warning", "No disks in the list to convert!")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Convert Disks")
+        dialog.transient(self.root)
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        selected = self.get_selected_disk()
+        scope = tk.StringVar(value="selected" if selected else "all")
+        output_format = tk.StringVar(value="qcow2")
+        compress = tk.BooleanVar(value=True)
+        coroutines = tk.IntVar(value=8)
+        out_of_order = tk.BooleanVar(value=False)
+        cache_mode = tk.StringVar(value="")
+        max_jobs = tk.IntVar(value=2)
+        cpu_budget = tk.IntVar(value=os.cpu_count() or 1)
+        
+        ttk.Radiobutton(frame, text=f"Selected disk ({selected.filename})" if selected else "Selected disk",
+                        variable=scope, value="selected",
+                        state=tk.NORMAL if selected else tk.DISABLED).grid(row=0, column=0, columnspan=2, sticky="w")
+        ttk.Radiobutton(frame, text=f"All {len(self.disk_table)} disks in the list", variable=scope,
+                        value="all").grid(row=1, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        
+        ttk.Label(frame, text="Target format (-O):").grid(row=2, column=0, sticky="w", pady=2)
+        ttk.Combobox(frame, textvariable=output_format, values=CONVERT_FORMATS, width=10,
+                     state="readonly").grid(row=2, column=1, sticky="w")
+        ttk.Checkbutton(frame, text="Compress (-c, qcow2 only)",
+                        variable=compress).grid(row=3, column=0, columnspan=2, sticky="w", pady=2)
+        ttk.Label(frame, text="Coroutines (-m):").grid(row=4, column=0, sticky="w", pady=2)
+        ttk.Spinbox(frame, from_=1, to=16, width=5, textvariable=coroutines).grid(row=4, column=1, sticky="w")
+        ttk.Checkbutton(frame, text="Out-of-order writes (-W)",
+                        variable=out_of_order).grid(row=5, column=0, columnspan=2, sticky="w", pady=2)
+        ttk.Label(frame, text="Target cache mode (-t):").grid(row=6, column=0, sticky="w", pady=2)
+        ttk.Combobox(frame, textvariable=cache_mode, values=("",) + CONVERT_CACHE_MODES, width=12,
+                     state="readonly").grid(row=6, column=1, sticky="w")
+        ttk.Label(frame, text="Conversions at once (I/O budget):").grid(row=7, column=0, sticky="w", pady=2)
+        ttk.Spinbox(frame, from_=1, to=64, width=5, textvariable=max_jobs).grid(row=7, column=1, sticky="w")
+        ttk.Label(frame, text="Cores for compression (CPU budget):").grid(row=8, column=0, sticky="w", pady=2)
+        ttk.Spinbox(frame, from_=1, to=1024, width=5, textvariable=cpu_budget).grid(row=8, column=1, sticky="w")
+        
+        def start():
+            records = [selected] if scope.get() == "selected" else list(self.disk_table.rows)
+            skipped = []
+            if scope.get() == "all":
+                # Leave out images an earlier conversion added to the list
+                sources, skipped = convert_sources([record.full_path for record in records],
+                                                   output_format.get())
+                sources = set(sources)
+                records = [record for record in records if record.full_path in sources]
+            if not records:
+                messagebox.showinfo("Convert Disks", "Every listed disk was written by an "
+                                    "earlier conversion; nothing to convert.", parent=dialog)
+                return
+            try:
+                jobs = [ConvertJob(record.full_path, format=output_format.get(),
+                                   compress=compress.get(), coroutines=coroutines.get(),
+                                   out_of_order=out_of_order.get(), cache=cache_mode.get(),
+                                   virtual_size=record.virtual_size) for record in records]
+                budgets = (max_jobs.get(), cpu_budget.get())
+            except (ValueError, tk.TclError) as e:
+                messagebox.showerror("Error", f"Invalid conversion options:\n{str(e)}", parent=dialog)
+                return
+            dialog.destroy()
+            self.run_conversion(jobs, *budgets, skipped=skipped)
+        
+        ttk.Button(frame, text="Convert", command=start,
+                   style="Accent.TButton").grid(row=9, column=0, columnspan=2, pady=(15, 0))
+
+    def run_conversion(self, jobs, max_jobs, cpu_budget, skipped=()):
+        """Run convert jobs in the background and add the converted images to the list
+        
+        skipped holds (path, source) pairs left out as earlier outputs; they are
+        listed in the summary.
+        """
+        cache = self.probe_cache
+        rates = {}  # job -> latest bytes/s, only touched by the worker threads under rates_lock
+        rates_lock = threading.Lock()
+        
+        def job(task):
+            def on_progress(convert_job, percent, rate):
+                with rates_lock:
+                    rates[convert_job] = rate
+                    total = sum(rates.values())
+                task.report(total)
+            
+            def on_result(result):
+                with rates_lock:
+                    rates.pop(result.job, None)
+                    total = sum(rates.values())
+                task.report(total)
+                record = None
+                if result.status == ConvertResult.CONVERTED:
+                    try:
+                        record = cache.probe(result.job.target)
+                    except Exception:
+                        pass  # Converted fine; it just won't be added to the list
+                task.emit((result, record))
+            
+            results = convert_all(jobs, max_jobs=max_jobs, cpu_budget=cpu_budget,
+                                  on_progress=on_progress, on_result=on_result,
+                                  stop=lambda: task.cancelled)
+            cache.flush()
+            return results
+        
+        finished = []
+        current_rate = [0.0]  # Latest total reported by the workers
+        
+        def on_progress(rate):
+            current_rate[0] = rate
+            self.status_var.set(f"Converting: {len(finished)} of {len(jobs)} done, "
+                                f"{rate / 1e6:.1f} MB/s")
+        
+        def on_batch(items):
+            for result, record in items:
+                finished.append(result)
+                if record is not None and self.disks.add(record):
+                    self.add_disks_to_tree([record])
+            self.progress_bar.configure(maximum=len(jobs), value=len(finished))
+            on_progress(current_rate[0])
+        
+        def on_done(results):
+            converted = [r for r in results if r.status == ConvertResult.CONVERTED]
+            failed = sum(1 for r in results if r.status == ConvertResult.FAILED)
+            saved = sum(r.bytes_saved for r in converted)
+            summary = (f"{len(results)} job(s): {len(converted)} converted, {failed} failed, "
+                       f"{'saved' if saved >= 0 else 'grew by'} {format_size(abs(saved))}")
+            lines = [str(r) for r in results]
+            lines += [f"skipped {path}: converted from {origin} earlier" for path, origin in skipped]
+            self.status_var.set(f"Convert: {summary}")
+            self.show_text_window("Convert Disks", summary + "\n\n" + "\n".join(lines))
+        
+        def on_error(error):
+            messagebox.showerror("Error", f"Conversion failed:\n{str(error)}")
+            self.status_var.set("Conversion failed")
+        
+        self.status_var.set(f"Converting {len(jobs)} disk(s)...")
+        self.progress_bar.configure(value=0, maximum=len(jobs))
+        self.run_task(job, on_batch=on_batch, on_progress=on_progress, on_done=on_done,
+                      on_error=on_error)
+
+    def export_list(self):
+        """Export the disk list to a CSV, JSON Lines or Parquet file in the background"""
+        if not self.disks:
+            messagebox.showwarning("Warning", "No disks in the list to export!")
+            return
+        
+        # Ask for save location; the extension picks the format and gzip
+        default_filename = f"qemu_disks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Gzipped CSV files", "*.csv.gz"),
+                       ("JSON Lines files", "*.jsonl"), ("Gzipped JSON Lines files", "*.jsonl.gz"),
+                       ("Parquet files", "*.parquet"), ("All files", "*.*")],
+            initialfile=default_filename
+        )
+        
+        if not file_path:
+            return  # User cancelled
+        
+        disks = list(self.disks)  # Snapshot of the records; rows are built on the worker
+        
+        def job(task):
+            return export_disks(disks, file_path, on_progress=task.report,
+                                stop=lambda: task.cancelled)
+        
+        def on_progress(count):
+            self.status_var.set(f"Exporting: {count} of {len(disks)} disk(s) written")
+            self.progress_bar.configure(maximum=len(disks), value=count)
+        
+        def on_done(count):
+            if count is None:
+                self.status_var.set("Export cancelled")
+                return
+            
+            # Show success message
+            messagebox.showinfo("Export Successful", 
+                              f"Exported {count} disk(s) to:\n{file_path}")
+            self.status_var.set(f"Exported: {os.path.basename(file_path)}")
+            
+            # Offer to open the exported file
+            if messagebox.askyesno("Open File", "Would you like to open the exported file now?"):
+                try:
+                    open_file(file_path)
+                except OSError as e:
+                    messagebox.showerror("Error", f"Could not open the file:\n{str(e)}")
+        
+        def on_error(error):
+            messagebox.showerror("Export Error", f"Failed to export:\n{str(error)}")
+            self.status_var.set("Export failed")
+        
+        self.status_var.set(f"Exporting {len(disks)} disk(s)...")
+        self.progress_bar.configure(value=0, maximum=len(disks))
+        self.run_task(job, on_progress=on_progress, on_done=on_done, on_error=on_error)
+
+    def remove_from_list(self):
+        """Remove selected disk from the list (does not delete the file)"""
+        disk_info = self.get_selected_disk()
+        if not disk_info:
+            messagebox.showwarning("Warning", "Please select a disk from the list first!")
+            return
+        
+        # Confirm removal
+        filename = disk_info.filename
+        if messagebox.askyesno("Confirm", f"Remove '{filename}' from the list?\n\nNote: This does NOT delete the actual file."):
+            # Remove from the registry and the table
+            self.disks.remove(disk_info)
+            self.disk_table.remove(disk_info)
+            self.update_totals()
+            
+            self.status_var.set(f"Removed from list: {filename}")
+
+def run():
+    """Open the main window and run the Tk event loop"""
+    root = tk.Tk()
+    app = QEMUDiskCreator(root)
+    root.mainloop()
+
+
+# Main application entry point
+if __name__ == "__main__":
+    run()
\ No newline at end of file